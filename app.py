@@ -4,25 +4,34 @@ Pro RAG Chatbot — Streamlit interface for chatting with your documents.
 
 from __future__ import annotations
 
+import functools
 import html
 import io
+import itertools
 import json
+import os
 import shutil
+import string
 import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
-from pathlib import Path
 
 import streamlit as st
+import streamlit.components.v1 as components
 from langchain_core.messages import HumanMessage, SystemMessage
 
 from src.config import (
     DATA_DIR,
     VECTOR_DIR,
     TOP_K,
+    HNSW_EF_SEARCH,
     DEFAULT_TEMPERATURE,
     CHUNK_SIZE,
     CHUNK_OVERLAP,
     LLM_MODEL,
+    STREAM_FLUSH_MS,
+    MAX_HISTORY_TURNS,
 )
 import importlib
 import src.utils
@@ -32,17 +41,25 @@ from src.utils import (
     get_embeddings,
     get_llm,
     load_faiss_index,
+    with_search_depth,
+    embed_query,
     list_ollama_models,
     pull_ollama_model,
     get_index_stats,
     semantic_search,
 )
 from src.ingestion import ingest_all, ingest_url
+from src.cache import ResponseCache
 from src.core import (
-    get_rag_stream_with_scores,
+    get_rag_astream_with_scores,
+    retrieve_with_scores,
+    iter_async,
+    iter_text,
+    chunks_for_source,
     DEFAULT_SYSTEM_PROMPT,
     PERSONAS,
     generate_followups,
+    history_key,
 )
 
 
@@ -149,24 +166,62 @@ LANGUAGES: dict[str, str] = {
     "🇰🇷 Korean": "Respond entirely in Korean.",
 }
 
-QUICK_PROMPTS: list[tuple[str, str]] = [
-    ("📋 Summarize", "Provide a detailed summary of the document."),
-    ("🔑 Key Points", "What are the key points and main takeaways?"),
-    ("❓ What is this?", "What is this document about? Give an overview."),
-    ("👤 Author Info", "Who is the author and what are their credentials?"),
-    ("📊 Main Topics", "List all the main topics covered in this document."),
-    ("💡 Key Insights", "What are the most interesting insights from this document?"),
-    ("📖 Chapter List", "List all chapters or sections in this document."),
-    ("🎯 Conclusions", "What are the main conclusions or recommendations?"),
-]
+QUICK_PROMPTS: dict[str, str] = {
+    "📋 Summarize": "Provide a detailed summary of the document.",
+    "🔑 Key Points": "What are the key points and main takeaways?",
+    "❓ What is this?": "What is this document about? Give an overview.",
+    "👤 Author Info": "Who is the author and what are their credentials?",
+    "📊 Main Topics": "List all the main topics covered in this document.",
+    "💡 Key Insights": "What are the most interesting insights from this document?",
+    "📖 Chapter List": "List all chapters or sections in this document.",
+    "🎯 Conclusions": "What are the main conclusions or recommendations?",
+}
 
 SESSIONS_FILE = VECTOR_DIR.parent / ".chat_sessions.json"
 
+HISTORY_WINDOW = 40  # messages rendered per page of chat history
+# Shared worker threads (batch summaries, retrieval prefetch). Ollama serves
+# OLLAMA_NUM_PARALLEL requests at once and queues the rest; each parallel slot
+# holds its own KV cache, so more is not free.
+WORKER_THREADS = 4
+
+
+class _ChatHistory(deque):
+    """Chat memory capped at MAX_HISTORY_TURNS user/assistant pairs.
+
+    Prompts and the chat view only ever see the capped deque; messages pushed
+    out of it are kept in ``evicted`` so saves and exports stay complete.
+    """
+
+    def __init__(self, messages=()):
+        messages = list(messages)
+        cap = MAX_HISTORY_TURNS * 2
+        super().__init__(messages[-cap:], maxlen=cap)
+        self.evicted: list = messages[:-cap]
+
+    def append(self, msg) -> None:
+        if len(self) == self.maxlen:
+            self.evicted.append(self[0])
+        super().append(msg)
+
+    def __reduce__(self):
+        return type(self), (_full_history(self),)
+
+
+def _new_history(messages=()) -> _ChatHistory:
+    return _ChatHistory(messages)
+
+
+def _full_history(history) -> list:
+    """Every message of a chat, including those evicted from the capped history."""
+    return [*getattr(history, "evicted", ()), *history]
+
 
 # ── Session state defaults ────────────────────────────────────────────────────
 
 _DEFAULTS: dict = {
-    "history": [],
+    "history": _new_history(),
+    "history_window": HISTORY_WINDOW,
     "system_prompt": DEFAULT_SYSTEM_PROMPT,
     "response_count": 0,
     "saved_sessions": {},
@@ -177,6 +232,7 @@ _DEFAULTS: dict = {
     "persona": "📚 Default",
     "language": "🇬🇧 English",
     "followups": [],
+    "export_errors": {},
     "show_shortcuts": False,
     "doc_summaries": {},
     "openai_key": "",
@@ -200,13 +256,22 @@ def _load_sessions() -> None:
         pass
 
 
+def _snapshot_history() -> list:
+    """Copy the whole conversation, including messages evicted from the live deque.
+
+    A reference would not do: appends past ``maxlen`` evict the oldest
+    messages in place.
+    """
+    return _full_history(st.session_state.history)
+
+
 def _save_sessions() -> None:
     try:
         clean: dict[str, list] = {}
-        for name, hist in st.session_state.saved_sessions.items():
+        for name, saved in st.session_state.saved_sessions.items():
             clean[name] = [
                 {"role": m["role"], "content": m["content"]}
-                for m in hist
+                for m in saved
                 if isinstance(m, dict) and "role" in m and "content" in m
             ]
         SESSIONS_FILE.write_text(json.dumps(clean, indent=2), encoding="utf-8")
@@ -220,16 +285,8 @@ _load_sessions()
 # ── Helpers ────────────────────────────────────────────────────────────────────
 
 def _escape_js(text: str, max_len: int = 1000) -> str:
-    return (
-        text[:max_len]
-        .replace("\\", "\\\\")
-        .replace("'", "\\'")
-        .replace('"', '\\"')
-        .replace("\n", "\\n")
-        .replace("\r", "")
-        .replace("<", "\\x3c")
-        .replace(">", "\\x3e")
-    )
+    """Quoted JS string literal for *text*, safe inside a double-quoted HTML attribute."""
+    return html.escape(json.dumps(text[:max_len]), quote=True)
 
 
 def _build_effective_prompt() -> str:
@@ -240,29 +297,46 @@ def _build_effective_prompt() -> str:
     return base
 
 
+def _score_badge(score: float, cls: str) -> str:
+    return f'<span class="score-badge {cls}">{score:.0%}</span>'
+
+
+def _sources_html(docs: list) -> str:
+    """One HTML block for all retrieved chunks, so the expander holds a single element."""
+    rows = []
+    for doc in docs:
+        meta = doc.metadata
+        source = meta["source_name"]
+        page = meta.get("page", "?")
+        score = meta.get("score")
+        badge = _score_badge(score, meta["score_cls"]) if score is not None else ""
+        content = doc.page_content
+        snippet = content[:300] + "…" if len(content) > 300 else content
+        also_in = meta.get("also_in")
+        also = ""
+        if also_in:
+            where = ", ".join(
+                os.path.basename(src) if pg == "?" else f"{os.path.basename(src)} (p.{pg})"
+                for src, pg in also_in
+            )
+            also = f" · also in {html.escape(where)}"
+        rows.append(
+            f'<div class="src-item">'
+            f'<div class="sr-header"><span><strong>{html.escape(source)}</strong> (p.{page}){also}</span>{badge}</div>'
+            f'<p class="sr-body">{html.escape(snippet)}</p>'
+            f'</div>'
+        )
+    return "".join(rows)
+
+
 def _render_sources(docs: list, label: str = "📎 Sources") -> None:
     with st.expander(f"{label} ({len(docs)} chunks)"):
-        for doc in docs:
-            source = Path(doc.metadata.get("source", "Unknown")).name
-            page = doc.metadata.get("page", "?")
-            score = doc.metadata.get("score")
-            if score is not None:
-                cls = "score-high" if score >= 0.7 else ("score-mid" if score >= 0.4 else "score-low")
-                st.markdown(
-                    f'**{html.escape(source)}** (p.{page}) '
-                    f'<span class="score-badge {cls}">{score:.0%}</span>',
-                    unsafe_allow_html=True,
-                )
-            else:
-                st.write(f"- **{source}** (p.{page})")
-            content = doc.page_content
-            st.caption(content[:300] + "…" if len(content) > 300 else content)
+        st.markdown(_sources_html(docs), unsafe_allow_html=True)
 
 
 
 def _inject_tts_listener():
     """Injects a global event listener to handle TTS clicks, bypassing React sanitization."""
-    import streamlit.components.v1 as components
     js = """
     <script>
         (function() {
@@ -336,53 +410,117 @@ def _inject_tts_listener():
     components.html(js, height=0, width=0)
 
 
-def _render_action_buttons(text: str, theme_dict: dict, key_suffix: str = "") -> None:
+def _action_buttons_html(text: str) -> str:
+    """Copy / Read Aloud buttons for an answer; built once when the answer is stored."""
     # Escape for JS string literal (for Copy button)
     copy_safe = _escape_js(text)
-    
+
     # Escape for HTML attribute (for TTS data attribute)
     tts_text = text[:1500].replace("\n", " ").strip()
     tts_safe_attr = html.escape(tts_text, quote=True)
-    
-    accent = theme_dict["accent"]
-    
+
     # Note: We removed the inline onclick handler to prevent React Error #231.
     # The click is now handled by the global listener injected by _inject_tts_listener().
-    st.markdown(
-        f"""<div class="action-row">
-            <button class="action-btn" onclick="navigator.clipboard.writeText('{copy_safe}').then(()=>this.textContent='✅ Copied!')">📋 Copy</button>
+    return f"""<div class="action-row">
+            <button class="action-btn" onclick="navigator.clipboard.writeText({copy_safe}).then(()=>this.textContent='✅ Copied!')">📋 Copy</button>
             <button class="action-btn tts-btn" data-tts="{tts_safe_attr}">🔊 Read Aloud</button>
-        </div>""",
-        unsafe_allow_html=True,
-    )
+        </div>"""
 
 
-def _render_metrics(resp_time: float, resp_tokens: int) -> None:
+def _metrics_html(resp_time: float, resp_tokens: int) -> str:
     if not resp_time and not resp_tokens:
-        return
+        return ""
     tps = resp_tokens / resp_time if resp_time > 0 else 0
-    st.markdown(
+    return (
         f'<div class="perf-metrics">'
         f'<span class="perf-chip">⏱️ {resp_time:.1f}s</span>'
         f'<span class="perf-chip">📝 {resp_tokens} tok</span>'
         f'<span class="perf-chip">⚡ {tps:.1f} t/s</span>'
-        f'</div>',
-        unsafe_allow_html=True,
+        f'</div>'
     )
 
 
+def _answer_footer_html(msg: dict) -> str:
+    return _metrics_html(msg.get("time", 0), msg.get("tokens", 0)) + _action_buttons_html(msg["content"])
+
+
+def _render_answer_footer(msg: dict) -> None:
+    """Metrics chips and Copy / Read Aloud buttons as one element."""
+    if "footer_html" not in msg:  # messages from sessions loaded off disk
+        msg["footer_html"] = _answer_footer_html(msg)
+    st.markdown(msg["footer_html"], unsafe_allow_html=True)
+
+
+def _on_quick_prompt() -> None:
+    """Queue the selected quick prompt; runs before the rerun, so no st.rerun() needed."""
+    label = st.session_state.qp_choice
+    st.session_state.qp_choice = None
+    if label:
+        st.session_state.history.append({"role": "user", "content": QUICK_PROMPTS[label]})
+
+
+def _request_followups() -> None:
+    """Flag the chat fragment to generate follow-ups on its rerun.
+
+    Generation happens in the fragment body: elements drawn inside a
+    fragment's widget callback would land at the top of the page.
+    """
+    st.session_state.followups_requested = True
+
+
+def _show_earlier_messages() -> None:
+    st.session_state.history_window += HISTORY_WINDOW
+
+
 def _reset_chat_state() -> None:
-    st.session_state.history = []
+    st.session_state.history = _new_history()
+    st.session_state.history_window = HISTORY_WINDOW
     st.session_state.response_count = 0
     st.session_state.total_tokens = 0
     st.session_state.total_time = 0.0
     st.session_state.followups = []
 
 
+def _deferred_export(build, errors: dict, *args, **kwargs):
+    """Run an export builder when its download is clicked.
+
+    It runs outside the script, where ``st.error`` is ignored, so a failure
+    is recorded in *errors* for the next rerun to show, then re-raised so no
+    broken file is served.
+    """
+    try:
+        return build(*args, **kwargs)
+    except Exception as exc:
+        errors[build.__name__] = str(exc)
+        raise
+
+
+def _generate_chat_markdown(session_name: str, history: list) -> str:
+    """Render the chat history as a Markdown document."""
+    history = _full_history(history)
+    lines = [
+        "# Pro RAG Chat Export",
+        f"_Session: {session_name}_",
+        f"_Exported: {datetime.now().strftime('%Y-%m-%d %H:%M')}_\n",
+    ]
+    for msg in history:
+        role = "**You**" if msg["role"] == "user" else "**AI**"
+        lines.append(f"{role}: {msg['content']}\n")
+    return "\n".join(lines)
+
+
+def _latin1(text: str) -> str:
+    """Replace what the core PDF fonts can't encode (emoji, CJK…) with '?'."""
+    return text.encode("latin-1", "replace").decode("latin-1")
+
+
 def _generate_chat_pdf(session_name: str, history: list, model: str = "") -> bytes:
     """Generate a professional PDF export of the chat history."""
     from fpdf import FPDF
 
+    history = _full_history(history)
+    session_name, model = _latin1(session_name), _latin1(model)
+
     pdf = FPDF()
     pdf.set_auto_page_break(auto=True, margin=20)
     pdf.add_page()
@@ -435,8 +573,7 @@ def _generate_chat_pdf(session_name: str, history: list, model: str = "") -> byt
         content = msg["content"]
         # Clean content for PDF (remove markdown formatting)
         content = content.replace("**", "").replace("*", "").replace("`", "")
-        # Encode to latin-1 safe
-        content = content.encode("latin-1", "replace").decode("latin-1")
+        content = _latin1(content)
         pdf.multi_cell(0, 5.5, content)
 
         # Performance metrics for AI messages
@@ -462,129 +599,127 @@ def _generate_chat_pdf(session_name: str, history: list, model: str = "") -> byt
     pdf.set_text_color(150, 150, 150)
     pdf.cell(0, 5, f"Generated by Pro RAG Intelligence  |  {datetime.now().strftime('%Y-%m-%d %H:%M')}", align="C")
 
-    return pdf.output()
+    return bytes(pdf.output())
 
 
 # ── Premium CSS ────────────────────────────────────────────────────────────────
 
-t = THEMES[st.session_state.theme]
-
 st.markdown('<meta name="viewport" content="width=device-width, initial-scale=1.0, maximum-scale=1.0, user-scalable=no">', unsafe_allow_html=True)
 
-st.markdown(f"""
+_PREMIUM_CSS = string.Template("""
 <style>
     /* ── Fonts ──────────────────────────────────────────── */
     @import url('https://fonts.googleapis.com/css2?family=Inter:wght@300;400;500;600;700;800;900&family=JetBrains+Mono:wght@400;500&display=swap');
-    html, body, [class*="css"] {{ font-family: 'Inter', sans-serif !important; }}
+    html, body, [class*="css"] { font-family: 'Inter', sans-serif !important; }
 
     /* ── Animated Background ─────────────────────────────── */
-    .stApp {{
+    .stApp {
         background: #050510 !important;
         overflow-x: hidden;
-    }}
-    .bg-mesh {{
+    }
+    .bg-mesh {
         position: fixed;
         top: -50%; left: -50%;
         width: 200%; height: 200%;
         background:
-            radial-gradient(ellipse at 20% 50%, {t['accent']}25 0%, transparent 50%),
-            radial-gradient(ellipse at 80% 20%, {t['accent2']}20 0%, transparent 40%),
-            radial-gradient(ellipse at 50% 80%, {t['accent']}15 0%, transparent 45%);
+            radial-gradient(ellipse at 20% 50%, ${accent}25 0%, transparent 50%),
+            radial-gradient(ellipse at 80% 20%, ${accent2}20 0%, transparent 40%),
+            radial-gradient(ellipse at 50% 80%, ${accent}15 0%, transparent 45%);
         animation: bgDrift 20s ease-in-out infinite alternate;
         pointer-events: none;
         z-index: 0;
-    }}
-    @keyframes bgDrift {{
-        0%   {{ transform: translate(0, 0) rotate(0deg); }}
-        100% {{ transform: translate(-3%, 2%) rotate(3deg); }}
-    }}
-    .bg-orb {{
+    }
+    @keyframes bgDrift {
+        0%   { transform: translate(0, 0) rotate(0deg); }
+        100% { transform: translate(-3%, 2%) rotate(3deg); }
+    }
+    .bg-orb {
         position: fixed;
         top: 10%; right: 5%;
         width: 400px; height: 400px;
-        background: radial-gradient(circle, {t['accent']}35 0%, transparent 70%);
+        background: radial-gradient(circle, ${accent}35 0%, transparent 70%);
         border-radius: 50%;
         filter: blur(80px);
         animation: orb1 15s ease-in-out infinite alternate;
         pointer-events: none;
         z-index: 0;
-    }}
-    .bg-orb2 {{
+    }
+    .bg-orb2 {
         position: fixed;
         bottom: 5%; left: 10%;
         width: 300px; height: 300px;
-        background: radial-gradient(circle, {t['accent2']}25 0%, transparent 70%);
+        background: radial-gradient(circle, ${accent2}25 0%, transparent 70%);
         border-radius: 50%;
         filter: blur(70px);
         animation: orb2 18s ease-in-out infinite alternate;
         pointer-events: none;
         z-index: 0;
-    }}
-    @keyframes orb1 {{
-        0%   {{ transform: translate(0, 0) scale(1); opacity: 0.7; }}
-        50%  {{ transform: translate(-80px, 60px) scale(1.3); opacity: 0.4; }}
-        100% {{ transform: translate(40px, -30px) scale(0.9); opacity: 0.6; }}
-    }}
-    @keyframes orb2 {{
-        0%   {{ transform: translate(0, 0) scale(1); opacity: 0.5; }}
-        50%  {{ transform: translate(60px, -40px) scale(1.1); opacity: 0.3; }}
-        100% {{ transform: translate(-30px, 50px) scale(0.85); opacity: 0.6; }}
-    }}
-    .block-container {{
+    }
+    @keyframes orb1 {
+        0%   { transform: translate(0, 0) scale(1); opacity: 0.7; }
+        50%  { transform: translate(-80px, 60px) scale(1.3); opacity: 0.4; }
+        100% { transform: translate(40px, -30px) scale(0.9); opacity: 0.6; }
+    }
+    @keyframes orb2 {
+        0%   { transform: translate(0, 0) scale(1); opacity: 0.5; }
+        50%  { transform: translate(60px, -40px) scale(1.1); opacity: 0.3; }
+        100% { transform: translate(-30px, 50px) scale(0.85); opacity: 0.6; }
+    }
+    .block-container {
         padding-top: 0.8rem !important;
         position: relative;
         z-index: 1;
-    }}
+    }
 
     /* ── Sidebar ─────────────────────────────────────────── */
-    [data-testid="stSidebar"] > div:first-child {{
-        background: linear-gradient(195deg, {t['sidebar_bg']} 0%, #050510 50%, {t['sidebar_bg2']} 100%) !important;
-        border-right: 1px solid {t['border']};
+    [data-testid="stSidebar"] > div:first-child {
+        background: linear-gradient(195deg, ${sidebar_bg} 0%, #050510 50%, ${sidebar_bg2} 100%) !important;
+        border-right: 1px solid ${border};
         box-shadow: 4px 0 40px rgba(0,0,0,0.5);
         overflow-x: hidden !important;
-    }}
-    [data-testid="stSidebar"] {{
+    }
+    [data-testid="stSidebar"] {
         overflow-x: hidden !important;
-    }}
-    [data-testid="stSidebar"] * {{
+    }
+    [data-testid="stSidebar"] * {
         max-width: 100% !important;
         box-sizing: border-box !important;
-    }}
+    }
     [data-testid="stSidebar"] .block-container,
     [data-testid="stSidebar"] [data-testid="stVerticalBlockBorderWrapper"],
-    [data-testid="stSidebar"] [data-testid="stVerticalBlock"] {{
+    [data-testid="stSidebar"] [data-testid="stVerticalBlock"] {
         overflow-x: hidden !important;
-    }}
-    [data-testid="stSidebar"] [data-testid="stMarkdownContainer"] {{
+    }
+    [data-testid="stSidebar"] [data-testid="stMarkdownContainer"] {
         overflow-x: hidden !important;
         word-break: break-word;
-    }}
-    [data-testid="stSidebar"] [data-testid="stMarkdownContainer"] p {{
-        color: {t['text_secondary']};
+    }
+    [data-testid="stSidebar"] [data-testid="stMarkdownContainer"] p {
+        color: ${text_secondary};
         overflow-wrap: break-word;
         word-break: break-word;
-    }}
+    }
 
-    .sb-brand {{
+    .sb-brand {
         padding: 0rem 0 1.5rem 0;
         margin-bottom: 0.5rem;
-        border-bottom: 1px solid {t['border']};
+        border-bottom: 1px solid ${border};
         position: relative;
         overflow: hidden;
-    }}
-    .sb-brand::after {{
+    }
+    .sb-brand::after {
         content: '';
         position: absolute;
         bottom: -1px; left: 0; right: 0;
         height: 1px;
-        background: {t['gradient']};
+        background: ${gradient};
         opacity: 0.5;
-    }}
-    .sb-brand-name {{
+    }
+    .sb-brand-name {
         font-size: 1.5rem;
         font-weight: 900;
         letter-spacing: -0.5px;
-        background: {t['gradient']};
+        background: ${gradient};
         -webkit-background-clip: text;
         -webkit-text-fill-color: transparent;
         line-height: 1.2;
@@ -592,11 +727,11 @@ st.markdown(f"""
         text-overflow: ellipsis;
         white-space: nowrap;
         max-width: 100%;
-    }}
-    .sb-brand-tag {{
+    }
+    .sb-brand-tag {
         font-size: 0.6rem;
         font-weight: 500;
-        color: {t['text_muted']};
+        color: ${text_muted};
         text-transform: uppercase;
         letter-spacing: 2.5px;
         margin-top: 2px;
@@ -604,120 +739,120 @@ st.markdown(f"""
         text-overflow: ellipsis;
         white-space: nowrap;
         max-width: 100%;
-    }}
+    }
 
     /* Sidebar sections */
-    .sb-label {{
+    .sb-label {
         display: flex;
         align-items: center;
         gap: 0.45rem;
         font-size: 0.6rem;
         font-weight: 700;
-        color: {t['accent']};
+        color: ${accent};
         text-transform: uppercase;
         letter-spacing: 2.5px;
         margin: 1.4rem 0 0.5rem 0;
-    }}
-    .sb-label::after {{
+    }
+    .sb-label::after {
         content: '';
         flex: 1;
         height: 1px;
-        background: linear-gradient(90deg, {t['accent']}40, transparent);
-    }}
+        background: linear-gradient(90deg, ${accent}40, transparent);
+    }
 
     /* File list */
-    .doc-item {{
+    .doc-item {
         display: flex;
         align-items: center;
         gap: 0.55rem;
         padding: 0.45rem 0.65rem;
         margin-bottom: 0.25rem;
         border-radius: 8px;
-        background: {t['hover_bg']};
+        background: ${hover_bg};
         border: 1px solid transparent;
         transition: all 0.3s cubic-bezier(0.175, 0.885, 0.32, 1.275);
         font-size: 0.78rem;
-        color: {t['text_primary']};
+        color: ${text_primary};
         overflow: hidden;
         max-width: 100%;
-    }}
-    .doc-item:hover {{
-        border-color: {t['accent']}30;
-        background: {t['accent_glow']};
+    }
+    .doc-item:hover {
+        border-color: ${accent}30;
+        background: ${accent_glow};
         transform: translateX(4px);
-        box-shadow: -3px 0 0 {t['accent']};
-    }}
-    .doc-name {{
+        box-shadow: -3px 0 0 ${accent};
+    }
+    .doc-name {
         overflow: hidden;
         text-overflow: ellipsis;
         white-space: nowrap;
         min-width: 0;
         flex: 1;
-    }}
-    .doc-icon {{
+    }
+    .doc-icon {
         width: 30px; height: 30px;
         border-radius: 8px;
-        background: linear-gradient(135deg, {t['accent']}20, {t['accent2']}15);
-        border: 1px solid {t['accent']}20;
+        background: linear-gradient(135deg, ${accent}20, ${accent2}15);
+        border: 1px solid ${accent}20;
         display: flex; align-items: center; justify-content: center;
         font-size: 0.85rem;
         flex-shrink: 0;
-    }}
-    .doc-meta {{
+    }
+    .doc-meta {
         margin-left: auto;
         font-size: 0.65rem;
-        color: {t['text_muted']};
+        color: ${text_muted};
         white-space: nowrap;
         flex-shrink: 0;
-    }}
+    }
 
     /* ── Top Bar (popover buttons) ────────────────────────── */
-    [data-testid="stPopover"] > button {{
-        background: linear-gradient(135deg, {t['hover_bg']}, rgba(255,255,255,0.02)) !important;
-        border: 1px solid {t['border']} !important;
+    [data-testid="stPopover"] > button {
+        background: linear-gradient(135deg, ${hover_bg}, rgba(255,255,255,0.02)) !important;
+        border: 1px solid ${border} !important;
         border-radius: 12px !important;
         padding: 0.35rem 0.85rem !important;
         font-size: 0.72rem !important;
         font-weight: 600 !important;
-        color: {t['text_secondary']} !important;
+        color: ${text_secondary} !important;
         transition: all 0.3s cubic-bezier(0.175, 0.885, 0.32, 1.275) !important;
         min-height: 36px !important;
         backdrop-filter: blur(10px) !important;
         position: relative !important;
         overflow: hidden !important;
-    }}
-    [data-testid="stPopover"] > button:hover {{
-        border-color: {t['accent']}50 !important;
-        color: {t['accent']} !important;
-        box-shadow: 0 4px 20px {t['accent']}20, 0 0 30px {t['accent']}08 !important;
+    }
+    [data-testid="stPopover"] > button:hover {
+        border-color: ${accent}50 !important;
+        color: ${accent} !important;
+        box-shadow: 0 4px 20px ${accent}20, 0 0 30px ${accent}08 !important;
         transform: translateY(-2px) !important;
-    }}
-    [data-testid="stPopover"] [data-testid="stPopoverBody"] {{
-        background: {t['card_solid']} !important;
-        border: 1px solid {t['accent']}25 !important;
+    }
+    [data-testid="stPopover"] [data-testid="stPopoverBody"] {
+        background: ${card_solid} !important;
+        border: 1px solid ${accent}25 !important;
         border-radius: 14px !important;
         backdrop-filter: blur(24px) !important;
-        box-shadow: 0 20px 60px rgba(0,0,0,0.5), 0 0 40px {t['accent']}10 !important;
-    }}
+        box-shadow: 0 20px 60px rgba(0,0,0,0.5), 0 0 40px ${accent}10 !important;
+    }
 
     /* ── Hero Banner (3D) ────────────────────────────── */
-    .hero {{
-        background: {t['gradient']};
+    .hero {
+        background: ${gradient};
         padding: 2rem 2.5rem;
         border-radius: 20px;
         margin-bottom: 1.2rem;
         position: relative;
         overflow: hidden;
         box-shadow:
-            0 20px 60px {t['accent']}20,
+            0 20px 60px ${accent}20,
             inset 0 -1px 0 rgba(255,255,255,0.1);
         transform: perspective(800px) rotateX(1deg);
         transition: transform 0.5s ease;
-    }}
-    .hero:hover {{
+    }
+    .hero:hover {
         transform: perspective(800px) rotateX(0deg);
-    }}
-    .hero::before {{
+    }
+    .hero::before {
         content: '';
         position: absolute;
         top: -100px; right: -80px;
@@ -725,8 +860,8 @@ st.markdown(f"""
         background: rgba(255,255,255,0.08);
         border-radius: 50%;
         animation: heroFloat 8s ease-in-out infinite;
-    }}
-    .hero::after {{
+    }
+    .hero::after {
         content: '';
         position: absolute;
         bottom: -120px; left: 20%;
@@ -734,12 +869,12 @@ st.markdown(f"""
         background: rgba(255,255,255,0.04);
         border-radius: 50%;
         animation: heroFloat 12s ease-in-out infinite reverse;
-    }}
-    @keyframes heroFloat {{
-        0%, 100% {{ transform: translate(0, 0); }}
-        50%  {{ transform: translate(20px, -15px); }}
-    }}
-    .hero h1 {{
+    }
+    @keyframes heroFloat {
+        0%, 100% { transform: translate(0, 0); }
+        50%  { transform: translate(20px, -15px); }
+    }
+    .hero h1 {
         color: #fff !important;
         font-size: 2rem;
         font-weight: 900;
@@ -748,16 +883,16 @@ st.markdown(f"""
         position: relative;
         z-index: 1;
         text-shadow: 0 2px 20px rgba(0,0,0,0.3);
-    }}
-    .hero p {{
+    }
+    .hero p {
         color: rgba(255,255,255,0.8);
         font-size: 0.9rem;
         margin: 0.3rem 0 0 0;
         font-weight: 400;
         position: relative;
         z-index: 1;
-    }}
-    .hero-badge {{
+    }
+    .hero-badge {
         display: inline-flex;
         align-items: center;
         gap: 6px;
@@ -772,23 +907,23 @@ st.markdown(f"""
         font-weight: 500;
         position: relative;
         z-index: 1;
-    }}
+    }
 
     /* ── KPI Cards (3D float) ───────────────────────── */
-    .kpi-row {{
+    .kpi-row {
         display: grid;
         grid-template-columns: repeat(6, 1fr);
         gap: 0.75rem;
         margin-bottom: 1.2rem;
         perspective: 1000px;
-    }}
-    @media (max-width: 768px) {{
-        .kpi-row {{ grid-template-columns: repeat(3, 1fr); }}
-    }}
-    .kpi {{
-        background: {t['card_bg']};
+    }
+    @media (max-width: 768px) {
+        .kpi-row { grid-template-columns: repeat(3, 1fr); }
+    }
+    .kpi {
+        background: ${card_bg};
         backdrop-filter: blur(16px);
-        border: 1px solid {t['border']};
+        border: 1px solid ${border};
         border-radius: 14px;
         padding: 1rem 0.8rem;
         text-align: center;
@@ -796,43 +931,43 @@ st.markdown(f"""
         position: relative;
         overflow: hidden;
         transform-style: preserve-3d;
-    }}
-    .kpi::before {{
+    }
+    .kpi::before {
         content: '';
         position: absolute;
         top: 0; left: 0; right: 0;
         height: 2px;
-        background: {t['gradient']};
+        background: ${gradient};
         opacity: 0;
         transition: opacity 0.25s ease;
-    }}
-    .kpi:hover {{
+    }
+    .kpi:hover {
         transform: translateY(-8px) perspective(600px) rotateX(3deg) scale(1.02);
         box-shadow:
-            0 20px 50px {t['accent']}25,
-            0 0 30px {t['accent']}10;
-        border-color: {t['accent']}50;
-    }}
-    .kpi:hover::before {{ opacity: 1; }}
-    .kpi-val {{
+            0 20px 50px ${accent}25,
+            0 0 30px ${accent}10;
+        border-color: ${accent}50;
+    }
+    .kpi:hover::before { opacity: 1; }
+    .kpi-val {
         font-size: 1.8rem;
         font-weight: 900;
-        background: {t['gradient']};
+        background: ${gradient};
         -webkit-background-clip: text;
         -webkit-text-fill-color: transparent;
         line-height: 1.2;
-    }}
-    .kpi-lbl {{
+    }
+    .kpi-lbl {
         font-size: 0.65rem;
         font-weight: 700;
-        color: {t['text_muted']};
+        color: ${text_muted};
         text-transform: uppercase;
         letter-spacing: 2px;
         margin-top: 0.3rem;
-    }}
+    }
 
     /* ── Focus Indicator ─────────────────────────────────── */
-    .focus-bar {{
+    .focus-bar {
         background: linear-gradient(135deg, rgba(251,191,36,0.08), rgba(251,191,36,0.04));
         border: 1px solid rgba(251,191,36,0.25);
         border-radius: 10px;
@@ -843,421 +978,537 @@ st.markdown(f"""
         display: flex;
         align-items: center;
         gap: 0.5rem;
-    }}
+    }
 
     /* ── Quick Prompts ───────────────────────────────────── */
-    .qp-grid {{
+    .qp-grid {
         display: grid;
         grid-template-columns: repeat(4, 1fr);
         gap: 0.5rem;
         margin-bottom: 1rem;
-    }}
-    @media (max-width: 768px) {{
-        .qp-grid {{ grid-template-columns: repeat(2, 1fr); }}
-    }}
+    }
+    @media (max-width: 768px) {
+        .qp-grid { grid-template-columns: repeat(2, 1fr); }
+    }
 
     /* ── Chat Bubbles (3D slide) ───────────────────── */
-    .stChatMessage {{
+    .stChatMessage {
         animation: msgSlide 0.6s cubic-bezier(0.16, 1, 0.3, 1);
         border-radius: 18px !important;
         backdrop-filter: blur(16px) !important;
-    }}
-    @keyframes msgSlide {{
-        from {{ opacity: 0; transform: translateY(25px) scale(0.96); }}
-        to   {{ opacity: 1; transform: translateY(0) scale(1); }}
-    }}
+    }
+    @keyframes msgSlide {
+        from { opacity: 0; transform: translateY(25px) scale(0.96); }
+        to   { opacity: 1; transform: translateY(0) scale(1); }
+    }
 
     /* ── Perf Metrics ────────────────────────────────────── */
-    .perf-metrics {{
+    .perf-metrics {
         display: flex;
         gap: 0.5rem;
         padding: 0.35rem 0;
         flex-wrap: wrap;
-    }}
-    .perf-chip {{
-        background: linear-gradient(135deg, {t['hover_bg']}, rgba(255,255,255,0.02));
-        border: 1px solid {t['border']};
+    }
+    .perf-chip {
+        background: linear-gradient(135deg, ${hover_bg}, rgba(255,255,255,0.02));
+        border: 1px solid ${border};
         padding: 3px 12px;
         border-radius: 100px;
         font-size: 0.68rem;
-        color: {t['text_secondary']};
+        color: ${text_secondary};
         font-weight: 600;
         backdrop-filter: blur(8px);
-    }}
+    }
 
     /* ── Action Buttons ──────────────────────────────────── */
-    .action-row {{
+    .action-row {
         display: flex;
         gap: 0.4rem;
         flex-wrap: wrap;
         margin-top: 0.25rem;
-    }}
-    .action-btn {{
+    }
+    .action-btn {
         background: transparent;
-        border: 1px solid {t['border']};
+        border: 1px solid ${border};
         border-radius: 10px;
         padding: 5px 14px;
-        color: {t['text_secondary']};
+        color: ${text_secondary};
         cursor: pointer;
         font-size: 0.72rem;
         font-family: 'Inter', sans-serif;
         font-weight: 600;
         transition: all 0.3s cubic-bezier(0.175, 0.885, 0.32, 1.275);
-    }}
-    .action-btn:hover {{
-        border-color: {t['accent']};
-        color: {t['accent']};
-        background: {t['accent_glow']};
+    }
+    .action-btn:hover {
+        border-color: ${accent};
+        color: ${accent};
+        background: ${accent_glow};
         transform: translateY(-2px);
-        box-shadow: 0 4px 15px {t['accent']}15;
-    }}
+        box-shadow: 0 4px 15px ${accent}15;
+    }
 
     /* ── Score Badges ────────────────────────────────────── */
-    .score-badge {{
+    .score-badge {
         display: inline-block;
         padding: 2px 10px;
         border-radius: 100px;
         font-size: 0.7rem;
         font-weight: 700;
         margin-left: 6px;
-    }}
-    .score-high {{ background: rgba(74,222,128,0.14); color: #4ade80; border: 1px solid rgba(74,222,128,0.25); }}
-    .score-mid  {{ background: rgba(251,191,36,0.14); color: #fbbf24; border: 1px solid rgba(251,191,36,0.25); }}
-    .score-low  {{ background: rgba(248,113,113,0.14); color: #f87171; border: 1px solid rgba(248,113,113,0.25); }}
+    }
+    .score-high { background: rgba(74,222,128,0.14); color: #4ade80; border: 1px solid rgba(74,222,128,0.25); }
+    .score-mid  { background: rgba(251,191,36,0.14); color: #fbbf24; border: 1px solid rgba(251,191,36,0.25); }
+    .score-low  { background: rgba(248,113,113,0.14); color: #f87171; border: 1px solid rgba(248,113,113,0.25); }
 
     /* ── Search Results (3D cards) ────────────────── */
-    .sr-card {{
-        background: {t['card_bg']};
+    .sr-card {
+        background: ${card_bg};
         backdrop-filter: blur(16px);
-        border: 1px solid {t['border']};
+        border: 1px solid ${border};
         border-radius: 14px;
         padding: 1.1rem 1.2rem;
         margin-bottom: 0.8rem;
         transition: all 0.4s cubic-bezier(0.175, 0.885, 0.32, 1.275);
         position: relative;
         overflow: hidden;
-    }}
-    .sr-card::before {{
+    }
+    .sr-card::before {
         content: '';
         position: absolute;
         left: 0; top: 0; bottom: 0;
         width: 3px;
-        background: {t['gradient']};
+        background: ${gradient};
         opacity: 0;
         transition: opacity 0.3s ease;
-    }}
-    .sr-card:hover {{
+    }
+    .sr-card:hover {
         transform: translateY(-3px) translateX(3px);
-        box-shadow: 0 12px 40px {t['accent']}15;
-        border-color: {t['accent']}35;
-    }}
-    .sr-card:hover::before {{ opacity: 1; }}
-    .sr-header {{
+        box-shadow: 0 12px 40px ${accent}15;
+        border-color: ${accent}35;
+    }
+    .sr-card:hover::before { opacity: 1; }
+    .sr-header {
         display: flex;
         justify-content: space-between;
         align-items: center;
         margin-bottom: 0.5rem;
-    }}
-    .sr-header strong {{ color: {t['text_primary']}; }}
-    .sr-body {{
-        color: {t['text_secondary']};
+    }
+    .sr-header strong { color: ${text_primary}; }
+    .src-item { margin-bottom: 0.9rem; }
+    .sr-body {
+        color: ${text_secondary};
         font-size: 0.84rem;
         line-height: 1.6;
         margin: 0;
-    }}
+    }
 
     /* ── Shortcut Modal ──────────────────────────── */
-    .kb-modal {{
-        background: {t['card_bg']};
+    .kb-modal {
+        background: ${card_bg};
         backdrop-filter: blur(20px);
-        border: 1px solid {t['border']};
+        border: 1px solid ${border};
         border-radius: 16px;
         padding: 1.4rem 1.6rem;
         margin-bottom: 1rem;
         box-shadow: 0 10px 40px rgba(0,0,0,0.3);
-    }}
-    .kb-modal h3 {{
-        color: {t['accent']};
+    }
+    .kb-modal h3 {
+        color: ${accent};
         margin: 0 0 0.8rem 0;
         font-size: 1rem;
         font-weight: 800;
-    }}
-    .kb-row {{
+    }
+    .kb-row {
         display: flex;
         justify-content: space-between;
         align-items: center;
         padding: 0.4rem 0;
-        border-bottom: 1px solid {t['border']};
+        border-bottom: 1px solid ${border};
         font-size: 0.82rem;
-        color: {t['text_secondary']};
-    }}
-    .kb-key {{
-        background: linear-gradient(135deg, {t['hover_bg']}, rgba(255,255,255,0.03));
-        border: 1px solid {t['border']};
+        color: ${text_secondary};
+    }
+    .kb-key {
+        background: linear-gradient(135deg, ${hover_bg}, rgba(255,255,255,0.03));
+        border: 1px solid ${border};
         padding: 3px 12px;
         border-radius: 8px;
         font-family: 'JetBrains Mono', monospace;
         font-size: 0.74rem;
-        color: {t['accent']};
+        color: ${accent};
         font-weight: 500;
-    }}
+    }
 
     /* ── Tabs (holographic bar) ───────────────────── */
-    .stTabs [data-baseweb="tab-list"] {{
+    .stTabs [data-baseweb="tab-list"] {
         gap: 4px;
-        background: {t['card_bg']};
+        background: ${card_bg};
         border-radius: 14px;
         padding: 5px;
-        border: 1px solid {t['border']};
+        border: 1px solid ${border};
         backdrop-filter: blur(16px);
         box-shadow: 0 4px 20px rgba(0,0,0,0.2);
-    }}
-    .stTabs [data-baseweb="tab"] {{
+    }
+    .stTabs [data-baseweb="tab"] {
         border-radius: 10px;
-        color: {t['text_secondary']};
+        color: ${text_secondary};
         font-weight: 600;
         padding: 0.45rem 1.3rem;
         transition: all 0.3s ease;
-    }}
-    .stTabs [aria-selected="true"] {{
-        background: linear-gradient(135deg, {t['accent_glow']}, {t['accent']}12) !important;
-        color: {t['accent']} !important;
-        box-shadow: 0 0 20px {t['accent']}15;
-    }}
+    }
+    .stTabs [aria-selected="true"] {
+        background: linear-gradient(135deg, ${accent_glow}, ${accent}12) !important;
+        color: ${accent} !important;
+        box-shadow: 0 0 20px ${accent}15;
+    }
 
     /* ── Streamlit Elements 3D ────────────────────── */
-    .stButton > button {{
+    .stButton > button {
         border-radius: 12px !important;
         font-weight: 600 !important;
         transition: all 0.3s cubic-bezier(0.175, 0.885, 0.32, 1.275) !important;
-        border: 1px solid {t['border']} !important;
-    }}
-    .stButton > button:hover {{
+        border: 1px solid ${border} !important;
+    }
+    .stButton > button:hover {
         transform: translateY(-2px) !important;
-        box-shadow: 0 6px 20px {t['accent']}15 !important;
-    }}
+        box-shadow: 0 6px 20px ${accent}15 !important;
+    }
     [data-testid="stTextInput"] input,
-    [data-testid="stSelectbox"] > div > div {{
+    [data-testid="stSelectbox"] > div > div {
         border-radius: 12px !important;
-        border: 1px solid {t['border']} !important;
-        background: {t['hover_bg']} !important;
+        border: 1px solid ${border} !important;
+        background: ${hover_bg} !important;
         transition: all 0.3s ease !important;
-    }}
-    [data-testid="stTextInput"] input:focus {{
-        border-color: {t['accent']}60 !important;
-        box-shadow: 0 0 20px {t['accent']}10 !important;
-    }}
-    [data-testid="stExpander"] {{
-        border: 1px solid {t['border']} !important;
+    }
+    [data-testid="stTextInput"] input:focus {
+        border-color: ${accent}60 !important;
+        box-shadow: 0 0 20px ${accent}10 !important;
+    }
+    [data-testid="stExpander"] {
+        border: 1px solid ${border} !important;
         border-radius: 14px !important;
-        background: {t['card_bg']} !important;
+        background: ${card_bg} !important;
         backdrop-filter: blur(12px) !important;
-    }}
+    }
 
     /* ── Chat Input 3D ───────────────────────────────── */
-    [data-testid="stChatInput"] {{
+    [data-testid="stChatInput"] {
         border-radius: 16px !important;
-        border: 1px solid {t['border']} !important;
-        background: {t['card_bg']} !important;
+        border: 1px solid ${border} !important;
+        background: ${card_bg} !important;
         backdrop-filter: blur(16px) !important;
         box-shadow: 0 8px 32px rgba(0,0,0,0.3) !important;
         transition: all 0.3s ease !important;
-    }}
-    [data-testid="stChatInput"]:focus-within {{
-        border-color: {t['accent']}60 !important;
-        box-shadow: 0 8px 32px rgba(0,0,0,0.3), 0 0 30px {t['accent']}15 !important;
-    }}
-    [data-testid="stChatInput"] textarea {{
-        color: {t['text_primary']} !important;
+    }
+    [data-testid="stChatInput"]:focus-within {
+        border-color: ${accent}60 !important;
+        box-shadow: 0 8px 32px rgba(0,0,0,0.3), 0 0 30px ${accent}15 !important;
+    }
+    [data-testid="stChatInput"] textarea {
+        color: ${text_primary} !important;
         font-family: 'Inter', sans-serif !important;
-    }}
+    }
 
     /* ── Chat Message Containers ──────────────────────── */
-    [data-testid="stChatMessage"] {{
-        background: {t['card_bg']} !important;
-        border: 1px solid {t['border']} !important;
+    [data-testid="stChatMessage"] {
+        background: ${card_bg} !important;
+        border: 1px solid ${border} !important;
         border-radius: 16px !important;
         backdrop-filter: blur(12px) !important;
         padding: 1rem !important;
         margin-bottom: 0.6rem !important;
         transition: all 0.3s ease !important;
-    }}
-    [data-testid="stChatMessage"]:hover {{
-        border-color: {t['accent']}25 !important;
+    }
+    [data-testid="stChatMessage"]:hover {
+        border-color: ${accent}25 !important;
         box-shadow: 0 4px 20px rgba(0,0,0,0.2) !important;
-    }}
+    }
 
     /* ── Sources Expander 3D ──────────────────────────── */
-    [data-testid="stExpander"] details {{
-        border: 1px solid {t['border']} !important;
+    [data-testid="stExpander"] details {
+        border: 1px solid ${border} !important;
         border-radius: 14px !important;
-        background: {t['card_bg']} !important;
+        background: ${card_bg} !important;
         overflow: hidden;
         transition: all 0.3s ease !important;
-    }}
-    [data-testid="stExpander"] summary:hover {{
-        color: {t['accent']} !important;
-    }}
+    }
+    [data-testid="stExpander"] summary:hover {
+        color: ${accent} !important;
+    }
 
     /* ── File Uploader 3D ────────────────────────────── */
-    [data-testid="stFileUploader"] section {{
-        border: 2px dashed {t['border']} !important;
+    [data-testid="stFileUploader"] section {
+        border: 2px dashed ${border} !important;
         border-radius: 14px !important;
-        background: {t['hover_bg']} !important;
+        background: ${hover_bg} !important;
         transition: all 0.3s ease !important;
-    }}
-    [data-testid="stFileUploader"] section:hover {{
-        border-color: {t['accent']}50 !important;
-        box-shadow: 0 0 20px {t['accent']}08 !important;
-    }}
+    }
+    [data-testid="stFileUploader"] section:hover {
+        border-color: ${accent}50 !important;
+        box-shadow: 0 0 20px ${accent}08 !important;
+    }
 
     /* ── Slider 3D ───────────────────────────────────── */
-    [data-testid="stSlider"] [role="slider"] {{
-        background: {t['accent']} !important;
-        box-shadow: 0 0 10px {t['accent']}40 !important;
-    }}
+    [data-testid="stSlider"] [role="slider"] {
+        background: ${accent} !important;
+        box-shadow: 0 0 10px ${accent}40 !important;
+    }
 
     /* ── Scrollbar ────────────────────────────────── */
-    ::-webkit-scrollbar {{ width: 6px; height: 6px; }}
-    ::-webkit-scrollbar-track {{ background: transparent; }}
-    ::-webkit-scrollbar-thumb {{
-        background: {t['accent']}30;
+    ::-webkit-scrollbar { width: 6px; height: 6px; }
+    ::-webkit-scrollbar-track { background: transparent; }
+    ::-webkit-scrollbar-thumb {
+        background: ${accent}30;
         border-radius: 10px;
-    }}
-    ::-webkit-scrollbar-thumb:hover {{ background: {t['accent']}50; }}
+    }
+    ::-webkit-scrollbar-thumb:hover { background: ${accent}50; }
 
     /* ── Streamlit Alerts 3D ──────────────────────── */
-    [data-testid="stAlert"] {{
+    [data-testid="stAlert"] {
         border-radius: 14px !important;
         backdrop-filter: blur(12px) !important;
         border-width: 1px !important;
-    }}
+    }
 
     /* ── Spinner ────────────────────────────────── */
-    .stSpinner > div {{
-        border-top-color: {t['accent']} !important;
-    }}
+    .stSpinner > div {
+        border-top-color: ${accent} !important;
+    }
 
     /* ── Divider ────────────────────────────────── */
-    [data-testid="stSidebar"] hr {{
-        border-color: {t['border']} !important;
+    [data-testid="stSidebar"] hr {
+        border-color: ${border} !important;
         opacity: 0.5;
-    }}
+    }
 
     /* ── Markdown container ──────────────────────── */
-    .stMarkdown {{
-        color: {t['text_primary']};
-    }}
-    .stMarkdown h4 {{
-        color: {t['text_primary']} !important;
+    .stMarkdown {
+        color: ${text_primary};
+    }
+    .stMarkdown h4 {
+        color: ${text_primary} !important;
         font-weight: 700;
         margin-bottom: 0.5rem;
-    }}
+    }
 
     /* ═══════════════════════════════════════════════════════
        RESPONSIVE — TABLETS (≤ 1024px)
        ═══════════════════════════════════════════════════════ */
-    @media (max-width: 1024px) {{
-        .block-container {{ padding-left: 1rem !important; padding-right: 1rem !important; }}
-        .hero {{ padding: 1.5rem 1.8rem; border-radius: 16px; transform: none; }}
-        .hero:hover {{ transform: none; }}
-        .hero h1 {{ font-size: 1.6rem; }}
-        .kpi-row {{ grid-template-columns: repeat(3, 1fr); gap: 0.5rem; }}
-        .kpi {{ padding: 0.8rem 0.5rem; }}
-        .kpi-val {{ font-size: 1.4rem; }}
-        .sr-card {{ padding: 0.9rem; }}
-        .stTabs [data-baseweb="tab"] {{ padding: 0.4rem 0.9rem; font-size: 0.85rem; }}
-    }}
+    @media (max-width: 1024px) {
+        .block-container { padding-left: 1rem !important; padding-right: 1rem !important; }
+        .hero { padding: 1.5rem 1.8rem; border-radius: 16px; transform: none; }
+        .hero:hover { transform: none; }
+        .hero h1 { font-size: 1.6rem; }
+        .kpi-row { grid-template-columns: repeat(3, 1fr); gap: 0.5rem; }
+        .kpi { padding: 0.8rem 0.5rem; }
+        .kpi-val { font-size: 1.4rem; }
+        .sr-card { padding: 0.9rem; }
+        .stTabs [data-baseweb="tab"] { padding: 0.4rem 0.9rem; font-size: 0.85rem; }
+    }
 
     /* ═══════════════════════════════════════════════════════
        RESPONSIVE — SMALL TABLETS & LARGE PHONES (≤ 768px)
        ═══════════════════════════════════════════════════════ */
-    @media (max-width: 768px) {{
-        .block-container {{ padding-left: 0.5rem !important; padding-right: 0.5rem !important; padding-top: 0.4rem !important; }}
-        .bg-mesh, .bg-orb, .bg-orb2 {{ display: none; }}
-        .hero {{ padding: 1.2rem; border-radius: 14px; margin-bottom: 0.8rem; transform: none; }}
-        .hero:hover {{ transform: none; }}
-        .hero h1 {{ font-size: 1.3rem; }}
-        .hero p {{ font-size: 0.78rem; }}
-        .hero-badge {{ font-size: 0.68rem; padding: 0.25rem 0.7rem; }}
-        .hero::before {{ width: 150px; height: 150px; top: -60px; right: -40px; }}
-        .hero::after {{ width: 200px; height: 200px; }}
-        .kpi-row {{ grid-template-columns: repeat(3, 1fr); gap: 0.4rem; margin-bottom: 0.8rem; }}
-        .kpi {{ padding: 0.6rem 0.4rem; border-radius: 12px; }}
-        .kpi:hover {{ transform: none; box-shadow: none; }}
-        .kpi-val {{ font-size: 1.15rem; }}
-        .kpi-lbl {{ font-size: 0.52rem; letter-spacing: 1.5px; }}
-        .focus-bar {{ padding: 0.45rem 0.8rem; font-size: 0.75rem; border-radius: 10px; }}
-        .qp-grid {{ grid-template-columns: repeat(2, 1fr); }}
-        .sr-card {{ padding: 0.8rem; border-radius: 12px; }}
-        .sr-card:hover {{ transform: none; }}
-        .sr-header {{ flex-direction: column; align-items: flex-start; gap: 0.3rem; }}
-        .sr-body {{ font-size: 0.78rem; }}
-        .stTabs [data-baseweb="tab-list"] {{ border-radius: 12px; padding: 3px; overflow-x: auto; -webkit-overflow-scrolling: touch; }}
-        .stTabs [data-baseweb="tab"] {{ padding: 0.35rem 0.75rem; font-size: 0.8rem; white-space: nowrap; }}
-        .perf-chip {{ font-size: 0.62rem; padding: 2px 8px; }}
-        .action-btn {{ padding: 6px 14px; font-size: 0.7rem; min-height: 38px; }}
-        .kb-modal {{ padding: 1rem; border-radius: 14px; }}
-        .kb-row {{ font-size: 0.75rem; }}
-        [data-testid="stSidebar"] {{ min-width: 260px !important; max-width: 280px !important; }}
-        [data-testid="column"] {{ padding: 0 0.15rem !important; }}
-    }}
+    @media (max-width: 768px) {
+        .block-container { padding-left: 0.5rem !important; padding-right: 0.5rem !important; padding-top: 0.4rem !important; }
+        .bg-mesh, .bg-orb, .bg-orb2 { display: none; }
+        .hero { padding: 1.2rem; border-radius: 14px; margin-bottom: 0.8rem; transform: none; }
+        .hero:hover { transform: none; }
+        .hero h1 { font-size: 1.3rem; }
+        .hero p { font-size: 0.78rem; }
+        .hero-badge { font-size: 0.68rem; padding: 0.25rem 0.7rem; }
+        .hero::before { width: 150px; height: 150px; top: -60px; right: -40px; }
+        .hero::after { width: 200px; height: 200px; }
+        .kpi-row { grid-template-columns: repeat(3, 1fr); gap: 0.4rem; margin-bottom: 0.8rem; }
+        .kpi { padding: 0.6rem 0.4rem; border-radius: 12px; }
+        .kpi:hover { transform: none; box-shadow: none; }
+        .kpi-val { font-size: 1.15rem; }
+        .kpi-lbl { font-size: 0.52rem; letter-spacing: 1.5px; }
+        .focus-bar { padding: 0.45rem 0.8rem; font-size: 0.75rem; border-radius: 10px; }
+        .qp-grid { grid-template-columns: repeat(2, 1fr); }
+        .sr-card { padding: 0.8rem; border-radius: 12px; }
+        .sr-card:hover { transform: none; }
+        .sr-header { flex-direction: column; align-items: flex-start; gap: 0.3rem; }
+        .sr-body { font-size: 0.78rem; }
+        .stTabs [data-baseweb="tab-list"] { border-radius: 12px; padding: 3px; overflow-x: auto; -webkit-overflow-scrolling: touch; }
+        .stTabs [data-baseweb="tab"] { padding: 0.35rem 0.75rem; font-size: 0.8rem; white-space: nowrap; }
+        .perf-chip { font-size: 0.62rem; padding: 2px 8px; }
+        .action-btn { padding: 6px 14px; font-size: 0.7rem; min-height: 38px; }
+        .kb-modal { padding: 1rem; border-radius: 14px; }
+        .kb-row { font-size: 0.75rem; }
+        [data-testid="stSidebar"] { min-width: 260px !important; max-width: 280px !important; }
+        [data-testid="column"] { padding: 0 0.15rem !important; }
+    }
 
     /* ═══════════════════════════════════════════════════════
        RESPONSIVE — PHONES (≤ 480px)
        ═══════════════════════════════════════════════════════ */
-    @media (max-width: 480px) {{
-        .block-container {{ padding-left: 0.3rem !important; padding-right: 0.3rem !important; padding-top: 0.2rem !important; }}
-        .hero {{ padding: 0.9rem; border-radius: 12px; margin-bottom: 0.5rem; }}
-        .hero h1 {{ font-size: 1.05rem; }}
-        .hero p {{ font-size: 0.7rem; }}
-        .hero-badge {{ font-size: 0.62rem; padding: 0.2rem 0.5rem; }}
-        .hero::before, .hero::after {{ display: none; }}
-        .kpi-row {{ grid-template-columns: repeat(2, 1fr); gap: 0.3rem; margin-bottom: 0.5rem; }}
-        .kpi {{ padding: 0.5rem 0.3rem; border-radius: 10px; }}
-        .kpi-val {{ font-size: 1rem; }}
-        .kpi-lbl {{ font-size: 0.48rem; letter-spacing: 1px; }}
-        .focus-bar {{ padding: 0.38rem 0.6rem; font-size: 0.68rem; }}
-        .sr-card {{ padding: 0.65rem; margin-bottom: 0.5rem; border-radius: 10px; }}
-        .sr-body {{ font-size: 0.72rem; line-height: 1.45; }}
-        .score-badge {{ font-size: 0.6rem; padding: 1px 7px; }}
-        .stTabs [data-baseweb="tab-list"] {{ border-radius: 10px; padding: 2px; }}
-        .stTabs [data-baseweb="tab"] {{ padding: 0.28rem 0.55rem; font-size: 0.72rem; border-radius: 8px; }}
-        .action-row {{ gap: 0.3rem; }}
-        .action-btn {{ padding: 8px 14px; font-size: 0.66rem; min-height: 42px; border-radius: 10px; flex: 1; text-align: center; }}
-        .perf-chip {{ font-size: 0.56rem; padding: 2px 7px; }}
-        .kb-modal {{ padding: 0.8rem; border-radius: 12px; }}
-        .kb-modal h3 {{ font-size: 0.88rem; }}
-        .kb-row {{ font-size: 0.68rem; padding: 0.25rem 0; }}
-        .kb-key {{ font-size: 0.64rem; padding: 1px 7px; }}
-        [data-testid="stSidebar"] {{ min-width: 240px !important; max-width: 260px !important; }}
-        .sb-brand-name {{ font-size: 1.2rem; }}
-        .sb-brand-tag {{ font-size: 0.52rem; letter-spacing: 2px; }}
-        .sb-label {{ font-size: 0.55rem; margin: 0.9rem 0 0.35rem 0; }}
-        .doc-item {{ padding: 0.38rem 0.5rem; font-size: 0.72rem; gap: 0.4rem; }}
-        .doc-icon {{ width: 24px; height: 24px; font-size: 0.75rem; border-radius: 6px; }}
-        .doc-meta {{ font-size: 0.56rem; }}
-        [data-testid="column"] {{ padding: 0 0.08rem !important; }}
-        .stChatMessage {{ padding: 0.5rem !important; }}
+    @media (max-width: 480px) {
+        .block-container { padding-left: 0.3rem !important; padding-right: 0.3rem !important; padding-top: 0.2rem !important; }
+        .hero { padding: 0.9rem; border-radius: 12px; margin-bottom: 0.5rem; }
+        .hero h1 { font-size: 1.05rem; }
+        .hero p { font-size: 0.7rem; }
+        .hero-badge { font-size: 0.62rem; padding: 0.2rem 0.5rem; }
+        .hero::before, .hero::after { display: none; }
+        .kpi-row { grid-template-columns: repeat(2, 1fr); gap: 0.3rem; margin-bottom: 0.5rem; }
+        .kpi { padding: 0.5rem 0.3rem; border-radius: 10px; }
+        .kpi-val { font-size: 1rem; }
+        .kpi-lbl { font-size: 0.48rem; letter-spacing: 1px; }
+        .focus-bar { padding: 0.38rem 0.6rem; font-size: 0.68rem; }
+        .sr-card { padding: 0.65rem; margin-bottom: 0.5rem; border-radius: 10px; }
+        .sr-body { font-size: 0.72rem; line-height: 1.45; }
+        .score-badge { font-size: 0.6rem; padding: 1px 7px; }
+        .stTabs [data-baseweb="tab-list"] { border-radius: 10px; padding: 2px; }
+        .stTabs [data-baseweb="tab"] { padding: 0.28rem 0.55rem; font-size: 0.72rem; border-radius: 8px; }
+        .action-row { gap: 0.3rem; }
+        .action-btn { padding: 8px 14px; font-size: 0.66rem; min-height: 42px; border-radius: 10px; flex: 1; text-align: center; }
+        .perf-chip { font-size: 0.56rem; padding: 2px 7px; }
+        .kb-modal { padding: 0.8rem; border-radius: 12px; }
+        .kb-modal h3 { font-size: 0.88rem; }
+        .kb-row { font-size: 0.68rem; padding: 0.25rem 0; }
+        .kb-key { font-size: 0.64rem; padding: 1px 7px; }
+        [data-testid="stSidebar"] { min-width: 240px !important; max-width: 260px !important; }
+        .sb-brand-name { font-size: 1.2rem; }
+        .sb-brand-tag { font-size: 0.52rem; letter-spacing: 2px; }
+        .sb-label { font-size: 0.55rem; margin: 0.9rem 0 0.35rem 0; }
+        .doc-item { padding: 0.38rem 0.5rem; font-size: 0.72rem; gap: 0.4rem; }
+        .doc-icon { width: 24px; height: 24px; font-size: 0.75rem; border-radius: 6px; }
+        .doc-meta { font-size: 0.56rem; }
+        [data-testid="column"] { padding: 0 0.08rem !important; }
+        .stChatMessage { padding: 0.5rem !important; }
         [data-testid="stSelectbox"] > div > div,
-        [data-testid="stTextInput"] > div > div > input {{ min-height: 42px !important; font-size: 0.85rem !important; }}
-        .stButton > button {{ min-height: 42px !important; font-size: 0.82rem !important; }}
-    }}
+        [data-testid="stTextInput"] > div > div > input { min-height: 42px !important; font-size: 0.85rem !important; }
+        .stButton > button { min-height: 42px !important; font-size: 0.82rem !important; }
+    }
 
     /* ═══════════════════════════════════════════════════════
        TOUCH ENHANCEMENTS
        ═══════════════════════════════════════════════════════ */
-    @media (hover: none) and (pointer: coarse) {{
-        .kpi:hover, .sr-card:hover {{ transform: none; box-shadow: none; }}
-        .hero {{ transform: none; }}
-        .hero:hover {{ transform: none; }}
-        .doc-item:hover {{ border-color: transparent; background: {t['hover_bg']}; transform: none; box-shadow: none; }}
-        .action-btn {{ min-height: 44px; min-width: 44px; }}
-        .stButton > button {{ min-height: 44px !important; }}
-        .block-container, [data-testid="stSidebar"] > div:first-child {{ -webkit-overflow-scrolling: touch; }}
-    }}
+    @media (hover: none) and (pointer: coarse) {
+        .kpi:hover, .sr-card:hover { transform: none; box-shadow: none; }
+        .hero { transform: none; }
+        .hero:hover { transform: none; }
+        .doc-item:hover { border-color: transparent; background: ${hover_bg}; transform: none; box-shadow: none; }
+        .action-btn { min-height: 44px; min-width: 44px; }
+        .stButton > button { min-height: 44px !important; }
+        .block-container, [data-testid="stSidebar"] > div:first-child { -webkit-overflow-scrolling: touch; }
+    }
+</style>
+""")
+
+_OVERLAY_CSS = string.Template("""
+<style>
+/* Main Background & Font */
+.stApp {
+    background: ${gradient};
+    font-family: 'Inter', sans-serif;
+}
+
+/* Sidebar Styling */
+section[data-testid="stSidebar"] {
+    background-color: ${sidebar_bg};
+    border-right: 1px solid rgba(255, 255, 255, 0.1);
+}
+
+/* Glassmorphism Cards */
+.glass-card {
+    background: rgba(255, 255, 255, 0.05);
+    backdrop-filter: blur(12px);
+    -webkit-backdrop-filter: blur(12px);
+    border: 1px solid rgba(255, 255, 255, 0.1);
+    border-radius: 16px;
+    padding: 20px;
+    margin-bottom: 20px;
+    box-shadow: 0 4px 6px rgba(0, 0, 0, 0.1);
+}
+
+/* Chat Message Bubbles */
+.user-msg {
+    background: rgba(255, 255, 255, 0.1);
+    border-radius: 12px 12px 0 12px;
+    padding: 12px 16px;
+    margin: 8px 0;
+    color: #fff;
+    max-width: 85%;
+    margin-left: auto;
+}
+.ai-msg {
+    background: rgba(0, 0, 0, 0.2);
+    border-radius: 12px 12px 12px 0;
+    padding: 12px 16px;
+    margin: 8px 0;
+    color: #e0e0e0;
+    max-width: 85%;
+}
+
+/* Action Buttons (Copy/TTS) */
+.action-row {
+    display: flex;
+    gap: 8px;
+    margin-top: 8px;
+    opacity: 0.7;
+    transition: opacity 0.2s;
+}
+.action-row:hover { opacity: 1; }
+
+.action-btn {
+    background: transparent;
+    border: 1px solid rgba(255, 255, 255, 0.2);
+    color: #ccc;
+    border-radius: 4px;
+    padding: 4px 8px;
+    font-size: 0.75rem;
+    cursor: pointer;
+    transition: all 0.2s;
+}
+.action-btn:hover {
+    background: rgba(255, 255, 255, 0.1);
+    border-color: ${accent};
+    color: white;
+}
+
+/* Metrics Chips */
+.perf-metrics {
+    display: flex;
+    gap: 8px;
+    font-size: 0.7rem;
+    color: #888;
+    margin-top: 4px;
+}
+.perf-chip {
+    background: rgba(0,0,0,0.2);
+    padding: 2px 6px;
+    border-radius: 4px;
+}
+
+/* Badge Styles */
+.score-badge {
+    font-size: 0.75em;
+    padding: 2px 6px;
+    border-radius: 4px;
+    margin-left: 6px;
+    font-weight: 600;
+}
+.score-high { background-color: rgba(76, 175, 80, 0.2); color: #81c784; }
+.score-mid  { background-color: rgba(255, 152, 0, 0.2); color: #ffb74d; }
+.score-low  { background-color: rgba(244, 67, 54, 0.2);  color: #e57373; }
+
+/* Hide Streamlit default branding */
+#MainMenu {visibility: hidden;}
+footer {visibility: hidden;}
 </style>
-""", unsafe_allow_html=True)
+""")
+
+
+@st.cache_data(show_spinner=False)
+def _theme_css(theme_name: str) -> tuple[str, str]:
+    """Fill both stylesheets for a theme once; later reruns reuse the strings."""
+    theme = THEMES[theme_name]
+    return _PREMIUM_CSS.substitute(theme), _OVERLAY_CSS.substitute(theme)
+
+
+premium_css, overlay_css = _theme_css(st.session_state.theme)
+# Style-only st.html goes to the event container: no Markdown parsing, no visible block
+st.html(premium_css)
 
 # ── Animated background elements (injected as real HTML) ──────────────────────
 st.markdown(
@@ -1276,8 +1527,23 @@ def _cached_embeddings():
 
 
 @st.cache_resource
+def _worker_pool() -> ThreadPoolExecutor:
+    """Process-wide thread pool; app.py module globals are rebuilt on every rerun."""
+    return ThreadPoolExecutor(max_workers=WORKER_THREADS, thread_name_prefix="rag-worker")
+
+
+@st.cache_resource
+def _cached_llm_client(model: str, api_key: str | None = None):
+    return get_llm(model=model, api_key=api_key)
+
+
 def _cached_llm(temperature: float, model: str, api_key: str | None = None):
-    return get_llm(temperature=temperature, model=model, api_key=api_key)
+    """The cached client for *model*, at *temperature*.
+
+    A shallow ``model_copy`` shares the HTTP clients, so moving the temperature
+    slider neither reconnects nor leaves another cached handle behind.
+    """
+    return _cached_llm_client(model, api_key).model_copy(update={"temperature": temperature})
 
 
 @st.cache_resource
@@ -1285,6 +1551,169 @@ def _cached_vector_db(_embeddings):
     return load_faiss_index(_embeddings)
 
 
+@st.cache_resource
+def _cached_response_cache(_embeddings):
+    return ResponseCache(_embeddings)
+
+
+def _embed_query(query: str, vec=None):
+    """Unit query embedding, memoised per session so chat, cache and search share it.
+
+    Pass *vec* to record an embedding computed elsewhere (e.g. on a worker thread).
+    """
+    memo = st.session_state.setdefault("_qvec_cache", {})
+    if vec is None:
+        vec = memo.get(query)
+    if vec is None:
+        vec = embed_query(_cached_embeddings(), query)
+    if query not in memo:
+        if len(memo) >= 32:
+            memo.pop(next(iter(memo)))
+        memo[query] = vec
+    return vec
+
+
+def _prefetch_retrieval(query: str, embeddings, db, top_k: int, filter_path):
+    """Embed and search *query* off the script thread: ``(query_vec, docs)``.
+
+    Touches no Streamlit state, so it is safe to run on :func:`_worker_pool`.
+    """
+    vec = embed_query(embeddings, query)
+    return vec, retrieve_with_scores(db, query, top_k, filter_path, vec)
+
+
+def _iter_chunks(stream, counter: list[int]):
+    """Coalesce streamed text into one string per STREAM_FLUSH_MS window.
+
+    ``st.write_stream`` re-renders the whole answer for every value it
+    receives, so yielding per token would make streaming O(tokens²).
+    Chunks are still counted one by one in ``counter[0]``.
+    """
+    parts: list[str] = []
+    flush_interval = STREAM_FLUSH_MS / 1000
+    deadline = time.monotonic() + flush_interval
+    for text in iter_text(stream):
+        counter[0] += 1
+        parts.append(text)
+        now = time.monotonic()
+        if now >= deadline:
+            yield "".join(parts)
+            parts.clear()
+            deadline = now + flush_interval
+    if parts:
+        yield "".join(parts)
+
+
+def _iter_batches(batches, counter: list[int]):
+    """Join each batch from :func:`iter_async` into one string, counting chunks in ``counter[0]``."""
+    for batch in batches:
+        counter[0] += len(batch)
+        yield "".join(iter_text(batch))
+
+
+def _cached_stream(text: str):
+    """Replay a cached answer word by word so it renders like a live stream."""
+    for word in text.split(" "):
+        yield word + " "
+
+
+@st.cache_resource(ttl=300, max_entries=64, show_spinner=False)
+def _cached_retrieve(
+    query: str, top_k: int, filter_path, ef_search: int, index_mtime: float, _db, _query_vec,
+) -> list:
+    """Scored chunks for a query; asking again (Regenerate, cache off) skips the search."""
+    return retrieve_with_scores(_db, query, top_k, filter_path, _query_vec)
+
+
+def _index_mtime() -> float:
+    index_file = VECTOR_DIR / "index.faiss"
+    return index_file.stat().st_mtime if index_file.exists() else 0.0
+
+
+@st.cache_data(show_spinner=False)
+def _cached_index_stats(index_mtime: float) -> dict:
+    """Docstore scan for the KPI row; recomputed only when the index file changes."""
+    return get_index_stats(_cached_vector_db(_cached_embeddings()))
+
+
+@st.cache_data(ttl=30, show_spinner=False)
+def _cached_ollama_models() -> list[dict]:
+    """Installed Ollama models; the HTTP call runs at most every 30 s, not on every rerun."""
+    return list_ollama_models()
+
+
+def _data_dir_mtime() -> float:
+    return DATA_DIR.stat().st_mtime if DATA_DIR.exists() else 0.0
+
+
+@st.cache_data(show_spinner=False)
+def _scan_data_dir(dir_mtime: float) -> list[tuple[str, int]]:
+    """Return sorted (name, size) pairs for DATA_DIR, one scandir pass per directory change."""
+    if not DATA_DIR.exists():
+        return []
+    with os.scandir(DATA_DIR) as entries:
+        return sorted(
+            (e.name, e.stat().st_size)
+            for e in entries
+            if e.is_file() and "." in e.name and not e.name.startswith(".")
+        )
+
+
+def _invalidate_index_caches() -> None:
+    """Drop everything derived from the vector index after it is rebuilt or deleted.
+
+    Embeddings, LLM clients and the worker pool do not depend on the index and
+    stay cached (reloading the embedding model alone takes seconds).
+    """
+    _cached_vector_db.clear()
+    _cached_retrieve.clear()
+    _cached_response_cache.clear()
+    _cached_index_stats.clear()
+
+
+# ── Background ingestion ──────────────────────────────────────────────────────
+
+def _run_ingest(url: str | None, embeddings) -> tuple[bool, str]:
+    """Fetch *url* (if given) and rebuild the index. Runs on the ingest worker thread."""
+    msg = ""
+    if url:
+        ok, msg = ingest_url(url)
+        if not ok:
+            return False, msg
+    ingest_all(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP, embeddings=embeddings)
+    return True, msg
+
+
+def _start_ingest(url: str | None = None) -> None:
+    """Submit an ingestion job to this session's single-worker pool."""
+    if "_ingest_pool" not in st.session_state:
+        st.session_state._ingest_pool = ThreadPoolExecutor(max_workers=1)
+    st.session_state._ingest_future = st.session_state._ingest_pool.submit(
+        _run_ingest, url, _cached_embeddings(),
+    )
+
+
+@st.fragment(run_every=0.5)
+def _ingest_progress() -> None:
+    """Poll the running ingestion job without blocking the rest of the UI."""
+    future = st.session_state.get("_ingest_future")
+    if future is None:
+        return
+    if not future.done():
+        st.status("Indexing… chunking & embedding", state="running")
+        return
+
+    st.session_state._ingest_future = None
+    try:
+        ok, msg = future.result()
+    except Exception as exc:
+        ok, msg = False, str(exc)
+    st.session_state._ingest_result = (ok, msg)
+    if ok:
+        _invalidate_index_caches()
+    st.rerun()
+
+
 # ═══════════════════════════════════════════════════════════════════════════════
 # SIDEBAR
 # ═══════════════════════════════════════════════════════════════════════════════
@@ -1301,16 +1730,16 @@ with st.sidebar:
 
     # ── Documents ────────────────────────────────────────────────────
     st.markdown('<div class="sb-label">📚 Documents</div>', unsafe_allow_html=True)
-    files = sorted(DATA_DIR.glob("*.*")) if DATA_DIR.exists() else []
+    files = _scan_data_dir(_data_dir_mtime())
     if files:
-        for f in files:
-            sz = f.stat().st_size / 1024
-            ext = f.suffix.lstrip(".").upper()
+        for name, size in files:
+            sz = size / 1024
+            ext = name.rpartition(".")[2].upper()
             icon = "📕" if ext == "PDF" else ("📝" if ext in ("TXT", "MD") else "📄")
             st.markdown(
                 f'<div class="doc-item">'
                 f'<div class="doc-icon">{icon}</div>'
-                f'<span class="doc-name">{html.escape(f.name)}</span>'
+                f'<span class="doc-name">{html.escape(name)}</span>'
                 f'<span class="doc-meta">{ext} · {sz:.0f} KB</span>'
                 f'</div>',
                 unsafe_allow_html=True,
@@ -1322,7 +1751,7 @@ with st.sidebar:
     st.markdown('<div class="sb-label">🎯 Focus Mode</div>', unsafe_allow_html=True)
     focus_path = None
     if files:
-        file_names = [f.name for f in files]
+        file_names = [name for name, _ in files]
         selected_doc = st.selectbox(
             "Focus",
             ["All Documents"] + file_names,
@@ -1342,16 +1771,14 @@ with st.sidebar:
         accept_multiple_files=True,
         type=["pdf", "txt", "md"],
     )
-    if st.button("🚀 Ingest & Index", use_container_width=True):
+    ingest_running = st.session_state.get("_ingest_future") is not None
+    if st.button("🚀 Ingest & Index", use_container_width=True, disabled=ingest_running):
         if uploaded:
             DATA_DIR.mkdir(exist_ok=True)
             for f in uploaded:
                 (DATA_DIR / f.name).write_bytes(f.getbuffer())
-            with st.status("Indexing…") as status:
-                st.write("Chunking & embedding…")
-                ingest_all(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
-                status.update(label="✅ Index ready!", state="complete")
-            st.cache_resource.clear()
+            _scan_data_dir.clear()  # overwrites keep the directory mtime
+            _start_ingest()
             st.rerun()
         else:
             st.warning("Upload files first.")
@@ -1359,26 +1786,31 @@ with st.sidebar:
     # ── Web Ingest ───────────────────────────────────────────────────
     st.markdown('<div class="sb-label">🌐 Web Ingest</div>', unsafe_allow_html=True)
     url_input = st.text_input("URL", placeholder="https://…", label_visibility="collapsed")
-    if st.button("🔗 Fetch & Index", use_container_width=True):
+    if st.button("🔗 Fetch & Index", use_container_width=True, disabled=ingest_running):
         if url_input.strip():
-            with st.status("Fetching…") as status:
-                ok, msg = ingest_url(url_input.strip())
-                if ok:
-                    st.write(msg)
-                    ingest_all(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
-                    status.update(label="✅ Indexed!", state="complete")
-                    st.cache_resource.clear()
-                    time.sleep(1)
-                    st.rerun()
-                else:
-                    status.update(label=f"❌ {msg}", state="error")
+            _start_ingest(url_input.strip())
+            st.rerun()
         else:
             st.warning("Paste a URL first.")
 
+    if ingest_running:
+        _ingest_progress()
+    elif "_ingest_result" in st.session_state:
+        ok, msg = st.session_state.pop("_ingest_result")
+        if ok:
+            st.success(f"✅ Index ready! {msg}".strip())
+        else:
+            st.error(f"❌ {msg}")
+
     # ── Engine ───────────────────────────────────────────────────────
     st.markdown('<div class="sb-label">⚙️ Engine</div>', unsafe_allow_html=True)
     temperature = st.slider("Creativity", 0.0, 1.0, DEFAULT_TEMPERATURE, help="Higher = creative · Lower = precise")
     top_k = st.slider("Search Depth", 1, 10, TOP_K, help="Chunks retrieved per query")
+    ef_search = st.slider(
+        "Recall vs speed (ef_search)", 16, 512, max(HNSW_EF_SEARCH, TOP_K * 4), step=16,
+        help="Graph candidates explored per query (HNSW index) · Higher = more accurate, slower",
+    )
+    use_cache = st.toggle("Semantic cache", value=True, help="Reuse answers to repeated or paraphrased questions")
 
     # ── System Prompt ────────────────────────────────────────────────
     st.markdown('<div class="sb-label">✏️ System Prompt</div>', unsafe_allow_html=True)
@@ -1418,6 +1850,7 @@ with st.sidebar:
             with st.status(f"Pulling {new_model}…", expanded=True) as status:
                 success = pull_ollama_model(new_model.strip())
                 if success:
+                    _cached_ollama_models.clear()
                     status.update(label=f"✅ {new_model} ready!", state="complete")
                     time.sleep(1)
                     st.rerun()
@@ -1432,7 +1865,9 @@ with st.sidebar:
         for d in (DATA_DIR, VECTOR_DIR):
             if d.exists():
                 shutil.rmtree(d)
-        st.cache_resource.clear()
+        _invalidate_index_caches()
+        _scan_data_dir.clear()
+        _cached_ollama_models.clear()
         _reset_chat_state()
         st.success("Reset complete!")
         time.sleep(1)
@@ -1443,7 +1878,7 @@ with st.sidebar:
 # TOP BAR — Popover buttons (tap to reveal each control)
 # ═══════════════════════════════════════════════════════════════════════════════
 
-ollama_models = list_ollama_models()
+ollama_models = _cached_ollama_models()
 model_names = [m["name"] for m in ollama_models]
 model_labels = [f"🦙 {m['name']}  ({m['size_gb']} GB)" for m in ollama_models]
 
@@ -1523,14 +1958,14 @@ with pb5:
         with sc1:
             if st.button("💾 Save", use_container_width=True, key="tb_save"):
                 if session_name.strip():
-                    st.session_state.saved_sessions[session_name] = list(st.session_state.history)
+                    st.session_state.saved_sessions[session_name] = _snapshot_history()
                     st.session_state.active_session = session_name
                     _save_sessions()
                     st.toast("💾 Saved!")
         with sc2:
             if st.button("🆕 New", use_container_width=True, key="tb_new"):
                 if st.session_state.history and st.session_state.active_session:
-                    st.session_state.saved_sessions[st.session_state.active_session] = list(st.session_state.history)
+                    st.session_state.saved_sessions[st.session_state.active_session] = _snapshot_history()
                     _save_sessions()
                 st.session_state.active_session = f"Chat {len(st.session_state.saved_sessions) + 1}"
                 _reset_chat_state()
@@ -1548,179 +1983,67 @@ with pb5:
             )
             if load_session != "—":
                 if st.button("📂 Load", use_container_width=True, key="load_btn"):
-                    st.session_state.history = list(st.session_state.saved_sessions[load_session])
+                    st.session_state.history = _new_history(st.session_state.saved_sessions[load_session])
                     st.session_state.active_session = load_session
                     st.session_state.followups = []
                     st.rerun()
 
         # Initialize session state (chat history, etc.)
         if "history" not in st.session_state:
-            st.session_state.history = []
+            st.session_state.history = _new_history()
 
         # Inject TTS Listener for global event delegation
         _inject_tts_listener()
 
     # ── Theme & CSS ─────────────────────────────────────────────────────────────
-    if "theme" not in st.session_state:
-        st.session_state.theme = "Midnight Purple"
-        
-    theme_dict = THEMES.get(st.session_state.theme, THEMES["Midnight Purple"])
-    
-    CSS = f"""
-    <style>
-    /* Main Background & Font */
-    .stApp {{
-        background: {theme_dict['gradient']};
-        font-family: 'Inter', sans-serif;
-    }}
-    
-    /* Sidebar Styling */
-    section[data-testid="stSidebar"] {{
-        background-color: {theme_dict['sidebar_bg']};
-        border-right: 1px solid rgba(255, 255, 255, 0.1);
-    }}
-    
-    /* Glassmorphism Cards */
-    .glass-card {{
-        background: rgba(255, 255, 255, 0.05);
-        backdrop-filter: blur(12px);
-        -webkit-backdrop-filter: blur(12px);
-        border: 1px solid rgba(255, 255, 255, 0.1);
-        border-radius: 16px;
-        padding: 20px;
-        margin-bottom: 20px;
-        box-shadow: 0 4px 6px rgba(0, 0, 0, 0.1);
-    }}
-    
-    /* Chat Message Bubbles */
-    .user-msg {{
-        background: rgba(255, 255, 255, 0.1);
-        border-radius: 12px 12px 0 12px;
-        padding: 12px 16px;
-        margin: 8px 0;
-        color: #fff;
-        max-width: 85%;
-        margin-left: auto;
-    }}
-    .ai-msg {{
-        background: rgba(0, 0, 0, 0.2);
-        border-radius: 12px 12px 12px 0;
-        padding: 12px 16px;
-        margin: 8px 0;
-        color: #e0e0e0;
-        max-width: 85%;
-    }}
-    
-    /* Action Buttons (Copy/TTS) */
-    .action-row {{
-        display: flex;
-        gap: 8px;
-        margin-top: 8px;
-        opacity: 0.7;
-        transition: opacity 0.2s;
-    }}
-    .action-row:hover {{ opacity: 1; }}
-    
-    .action-btn {{
-        background: transparent;
-        border: 1px solid rgba(255, 255, 255, 0.2);
-        color: #ccc;
-        border-radius: 4px;
-        padding: 4px 8px;
-        font-size: 0.75rem;
-        cursor: pointer;
-        transition: all 0.2s;
-    }}
-    .action-btn:hover {{
-        background: rgba(255, 255, 255, 0.1);
-        border-color: {theme_dict['accent']};
-        color: white;
-    }}
-
-    /* Metrics Chips */
-    .perf-metrics {{
-        display: flex;
-        gap: 8px;
-        font-size: 0.7rem;
-        color: #888;
-        margin-top: 4px;
-    }}
-    .perf-chip {{
-        background: rgba(0,0,0,0.2);
-        padding: 2px 6px;
-        border-radius: 4px;
-    }}
-    
-    /* Badge Styles */
-    .score-badge {{
-        font-size: 0.75em;
-        padding: 2px 6px;
-        border-radius: 4px;
-        margin-left: 6px;
-        font-weight: 600;
-    }}
-    .score-high {{ background-color: rgba(76, 175, 80, 0.2); color: #81c784; }}
-    .score-mid  {{ background-color: rgba(255, 152, 0, 0.2); color: #ffb74d; }}
-    .score-low  {{ background-color: rgba(244, 67, 54, 0.2);  color: #e57373; }}
-
-    /* Hide Streamlit default branding */
-    #MainMenu {{visibility: hidden;}}
-    footer {{visibility: hidden;}}
-    </style>
-    """
-
-    # Apply custom CSS
-    st.markdown(CSS, unsafe_allow_html=True)
+    st.html(overlay_css)
 
     if st.session_state.history:
         st.markdown("---")
         exp_c1, exp_c2 = st.columns(2)
-        
-        # Markdown Export
-        lines_exp = [
-            "# Pro RAG Chat Export",
-            f"_Session: {st.session_state.active_session}_",
-            f"_Exported: {datetime.now().strftime('%Y-%m-%d %H:%M')}_\n",
-        ]
-        for msg in st.session_state.history:
-            role = "**You**" if msg["role"] == "user" else "**AI**"
-            lines_exp.append(f"{role}: {msg['content']}\n")
-        
+
+        # Payloads are built by the download buttons on click, not on every rerun.
         with exp_c1:
             st.download_button(
                 "📄 Export MD",
-                data="\n".join(lines_exp),
+                data=functools.partial(
+                    _generate_chat_markdown,
+                    st.session_state.active_session,
+                    st.session_state.history,
+                ),
                 file_name=f"{st.session_state.active_session}.md",
                 mime="text/markdown",
                 use_container_width=True,
             )
 
-        # PDF Export
         with exp_c2:
-            try:
-                # Ensure selected_model is available or fallback
-                model_name = selected_model if 'selected_model' in locals() else "Unknown Model"
-                pdf_bytes = _generate_chat_pdf(
+            # Ensure selected_model is available or fallback
+            model_name = selected_model if 'selected_model' in locals() else "Unknown Model"
+            pdf_error = st.session_state.export_errors.pop(_generate_chat_pdf.__name__, None)
+            if pdf_error:
+                st.error(f"PDF Gen Error: {pdf_error}")
+            st.download_button(
+                label="📕 Export PDF",
+                data=functools.partial(
+                    _deferred_export,
+                    _generate_chat_pdf,
+                    st.session_state.export_errors,
                     st.session_state.active_session,
                     st.session_state.history,
-                    model=model_name
-                )
-                st.download_button(
-                    label="📕 Export PDF",
-                    data=bytes(pdf_bytes),
-                    file_name=f"{st.session_state.active_session}.pdf",
-                    mime="application/pdf",
-                    use_container_width=True,
-                )
-            except Exception as e:
-                st.error(f"PDF Gen Error: {e}")
+                    model=model_name,
+                ),
+                file_name=f"{st.session_state.active_session}.pdf",
+                mime="application/pdf",
+                use_container_width=True,
+            )
 
 
 # ── Initialise resources ──────────────────────────────────────────────────────
 
 try:
     embeddings = _cached_embeddings()
-    vector_db = _cached_vector_db(embeddings)
+    # A per-run view: the cached index is shared, its search depth is not
+    vector_db = with_search_depth(_cached_vector_db(embeddings), max(ef_search, top_k))
     llm = _cached_llm(temperature, selected_model, api_key=st.session_state.openai_key)
 except Exception as e:
     st.error(f"Failed to initialize AI engine: {e}")
@@ -1736,7 +2059,12 @@ tab_chat, tab_search, tab_summary = st.tabs(["💬  Chat", "🔍  Search", "📑
 
 # ── TAB 1: CHAT ──────────────────────────────────────────────────────────────
 
-with tab_chat:
+@st.fragment
+def _chat_fragment(
+    vector_db, llm, focus_path, top_k: int, ef_search: int, selected_model: str,
+    temperature: float, use_cache: bool,
+) -> None:
+    """Chat tab body; chat interactions rerun only this fragment, not the whole page."""
     # Hero banner
     st.markdown(
         f'<div class="hero">'
@@ -1764,7 +2092,7 @@ with tab_chat:
 
     # KPI dashboard
     if vector_db is not None:
-        stats = get_index_stats(vector_db)
+        stats = _cached_index_stats(_index_mtime())
         avg_t = (
             st.session_state.total_time / st.session_state.response_count
             if st.session_state.response_count > 0 else 0
@@ -1783,7 +2111,7 @@ with tab_chat:
 
     if vector_db is None:
         st.warning("No document index found. Upload and ingest documents in the sidebar.")
-        st.stop()
+        return
 
     # Focus indicator
     if focus_path:
@@ -1795,39 +2123,37 @@ with tab_chat:
     # Quick prompts
     if not st.session_state.history:
         st.markdown("#### ⚡ Quick Prompts")
-        qp_cols = st.columns(4)
-        for i, (label, prompt_text) in enumerate(QUICK_PROMPTS):
-            with qp_cols[i % 4]:
-                if st.button(label, use_container_width=True, key=f"qp_{i}"):
-                    st.session_state.history.append({"role": "user", "content": prompt_text})
-                    st.rerun()
+        st.pills(
+            "Quick Prompts",
+            list(QUICK_PROMPTS),
+            key="qp_choice",
+            on_change=_on_quick_prompt,
+            label_visibility="collapsed",
+        )
 
-    # Chat history
-    for idx, msg in enumerate(st.session_state.history):
+    # Chat history — only the most recent window is rendered
+    history = st.session_state.history
+    start = max(0, len(history) - st.session_state.history_window)
+    if start:
+        st.button(
+            f"⬆️ Show earlier messages ({start} hidden)",
+            key="show_earlier",
+            on_click=_show_earlier_messages,
+        )
+    for msg in itertools.islice(history, start, None):
         with st.chat_message(msg["role"]):
             st.markdown(msg["content"])
             if msg["role"] == "assistant":
-                _render_metrics(msg.get("time", 0), msg.get("tokens", 0))
-                _render_action_buttons(msg["content"], t, key_suffix=f"hist_{idx}")
+                _render_answer_footer(msg)
             if msg.get("docs"):
                 _render_sources(msg["docs"])
 
-    # Follow-ups
-    if st.session_state.followups:
-        st.markdown("#### 🔗 Suggested Follow-ups")
-        fu_cols = st.columns(min(len(st.session_state.followups), 3))
-        for i, fu_q in enumerate(st.session_state.followups):
-            with fu_cols[i % 3]:
-                if st.button(fu_q, use_container_width=True, key=f"fu_{i}"):
-                    st.session_state.history.append({"role": "user", "content": fu_q})
-                    st.session_state.followups = []
-                    st.rerun()
-
     # Regenerate
     if len(st.session_state.history) >= 2 and st.session_state.history[-1]["role"] == "assistant":
         if st.button("🔄 Regenerate Last Response"):
             st.session_state.history.pop()
             st.session_state.followups = []
+            st.session_state.skip_cache = True
             st.rerun()
 
     # ── Determine if we need to generate a response ──────────────────────
@@ -1838,7 +2164,12 @@ with tab_chat:
         pending_prompt = st.session_state.history[-1]["content"]
 
     # Chat input (new message from the text box)
+    prefetch = None
     if new_input := st.chat_input("Ask about your documents…"):
+        # Embed + search while the user message renders and the prompt is assembled
+        prefetch = _worker_pool().submit(
+            _prefetch_retrieval, new_input, _cached_embeddings(), vector_db, top_k, focus_path,
+        )
         st.session_state.history.append({"role": "user", "content": new_input})
         with st.chat_message("user"):
             st.markdown(new_input)
@@ -1847,48 +2178,108 @@ with tab_chat:
     # ── Generate AI response if there's a pending prompt ─────────────────
     if pending_prompt:
         with st.chat_message("assistant"):
-            placeholder = st.empty()
-            full_response = ""
-            token_count = 0
+            token_counter = [0]
             start_time = time.time()
 
             effective_prompt = _build_effective_prompt()
-            stream, docs = get_rag_stream_with_scores(
-                pending_prompt, vector_db, llm,
-                top_k=top_k,
-                filter_path=focus_path,
-                chat_history=st.session_state.history[:-1],
-                system_prompt=effective_prompt,
-            )
+            cached = None
+            prefetched_docs = None
+            if prefetch is not None:
+                query_vec, prefetched_docs = prefetch.result()
+                _embed_query(pending_prompt, query_vec)
+            else:
+                query_vec = _embed_query(pending_prompt)
+            # Regenerate asks for a fresh answer; it still replaces the cached one below
+            skip_lookup = st.session_state.pop("skip_cache", False)
+            prior_history = list(itertools.islice(
+                st.session_state.history, 0, len(st.session_state.history) - 1,
+            ))
+            if use_cache:
+                response_cache = _cached_response_cache(_cached_embeddings())
+                # The cache is shared by all sessions; keying on the history keeps
+                # follow-ups from matching another conversation's answer
+                cache_scope = ResponseCache.scope(
+                    focus=focus_path, system_prompt=effective_prompt, top_k=top_k,
+                    model=selected_model, temperature=temperature,
+                    history=history_key(prior_history),
+                )
+                if not skip_lookup:
+                    cached = response_cache.get(pending_prompt, cache_scope, query_vec)
 
-            for chunk in stream:
-                content = getattr(chunk, "content", str(chunk))
-                full_response += content
-                token_count += 1
-                placeholder.markdown(full_response + "▌")
+            if cached:
+                cached_response, docs, cached_tokens = cached
+                text_stream = _iter_chunks(_cached_stream(cached_response), token_counter)
+            else:
+                docs = prefetched_docs
+                if docs is None:
+                    docs = _cached_retrieve(
+                        pending_prompt, top_k, focus_path, ef_search, _index_mtime(), vector_db, query_vec,
+                    )
+                astream, docs = get_rag_astream_with_scores(
+                    pending_prompt, vector_db, llm,
+                    chat_history=prior_history,
+                    system_prompt=effective_prompt,
+                    docs=docs,
+                )
+                text_stream = _iter_batches(iter_async(astream, STREAM_FLUSH_MS / 1000), token_counter)
 
+            full_response = st.write_stream(text_stream)
+            token_count = token_counter[0]
             elapsed = time.time() - start_time
-            placeholder.markdown(full_response)
+            if cached:
+                full_response, token_count = cached_response, cached_tokens
+            elif use_cache:
+                response_cache.put(pending_prompt, cache_scope, full_response, docs, token_count, query_vec)
 
-            _render_metrics(elapsed, token_count)
-            _render_action_buttons(full_response, t, key_suffix="new")
-
-            st.session_state.response_count += 1
-            st.session_state.total_tokens += token_count
-            st.session_state.total_time += elapsed
-
-            st.session_state.history.append({
+            answer = {
                 "role": "assistant",
                 "content": full_response,
                 "docs": docs,
                 "time": elapsed,
                 "tokens": token_count,
-            })
+            }
+            answer["footer_html"] = _answer_footer_html(answer)
+            _render_answer_footer(answer)
+
+            st.session_state.response_count += 1
+            st.session_state.total_tokens += token_count
+            st.session_state.total_time += elapsed
+
+            st.session_state.history.append(answer)
+            # Suggestions belong to the previous answer
+            st.session_state.followups = []
 
             _render_sources(docs)
 
-            with st.spinner("Generating follow-ups…"):
-                st.session_state.followups = generate_followups(pending_prompt, full_response, llm)
+        # The export controls live outside this fragment; show them after the first exchange
+        if len(st.session_state.history) == 2:
+            st.rerun()
+
+    # Follow-ups — rendered after any new answer, generated only on request
+    history = st.session_state.history
+    if st.session_state.pop("followups_requested", False):
+        with st.spinner("Generating follow-ups…"):
+            st.session_state.followups = generate_followups(
+                history[-2]["content"], history[-1]["content"], llm,
+            )
+    if st.session_state.followups:
+        st.markdown("#### 🔗 Suggested Follow-ups")
+        fu_cols = st.columns(min(len(st.session_state.followups), 3))
+        for i, fu_q in enumerate(st.session_state.followups):
+            with fu_cols[i % 3]:
+                if st.button(fu_q, use_container_width=True, key=f"fu_{i}"):
+                    st.session_state.history.append({"role": "user", "content": fu_q})
+                    st.session_state.followups = []
+                    st.rerun(scope="fragment")
+    elif len(history) >= 2 and history[-1]["role"] == "assistant":
+        st.button(
+            "💡 Suggest follow-ups", key=f"fup_{len(history)}",
+            on_click=_request_followups,
+        )
+
+
+with tab_chat:
+    _chat_fragment(vector_db, llm, focus_path, top_k, ef_search, selected_model, temperature, use_cache)
 
 
 # ── TAB 2: SEARCH ──────────────────────────────────────────────────────────
@@ -1909,28 +2300,53 @@ with tab_search:
         search_k = st.slider("Results", 1, 20, 10, key="search_k")
 
         if search_query:
-            results = semantic_search(vector_db, search_query, top_k=search_k, filter_path=focus_path)
+            results = semantic_search(
+                vector_db, search_query, top_k=search_k,
+                filter_path=focus_path, query_vec=_embed_query(search_query),
+            )
             if results:
                 st.markdown(f'**{len(results)}** results for *"{html.escape(search_query)}"*')
-                for r in results:
-                    score = r["score"]
-                    cls = "score-high" if score >= 0.7 else ("score-mid" if score >= 0.4 else "score-low")
-                    st.markdown(
+                st.markdown(
+                    "".join(
                         f'<div class="sr-card">'
                         f'<div class="sr-header">'
                         f'<span><strong>{html.escape(r["source"])}</strong> · Page {r["page"]}</span>'
-                        f'<span class="score-badge {cls}">{score:.0%}</span>'
+                        f'{_score_badge(r["score"], r["score_cls"])}'
                         f'</div>'
                         f'<p class="sr-body">{html.escape(r["content"][:500])}</p>'
-                        f'</div>',
-                        unsafe_allow_html=True,
-                    )
+                        f'</div>'
+                        for r in results
+                    ),
+                    unsafe_allow_html=True,
+                )
             else:
                 st.info("No results found.")
 
 
 # ── TAB 3: SUMMARIES ──────────────────────────────────────────────────────
 
+def _summarize_one(name: str, vector_db, llm) -> str | None:
+    """Summarize one indexed file; None if it has no chunks in the index.
+
+    Safe to run off the script thread: it does not touch st.session_state.
+    """
+    chunks = chunks_for_source(vector_db, DATA_DIR / name, k=8)
+    if not chunks:
+        return None
+    context = "\n\n".join(doc.page_content for doc in chunks)
+    msgs = [
+        SystemMessage(content=(
+            "You are a document summarizer. Provide a comprehensive, "
+            "well-structured summary. Use markdown with headers and bullets."
+        )),
+        HumanMessage(content=(
+            f"Document: {name}\n\nContent:\n{context}\n\nProvide a detailed summary:"
+        )),
+    ]
+    result = llm.invoke(msgs)
+    return getattr(result, "content", str(result))
+
+
 with tab_summary:
     st.markdown(
         '<div class="hero">'
@@ -1945,35 +2361,42 @@ with tab_summary:
     elif not files:
         st.info("No documents found.")
     else:
-        for f in files:
-            with st.expander(f"📄 {f.name}  ({f.stat().st_size / 1024:.0f} KB)", expanded=False):
-                if f.name in st.session_state.doc_summaries:
-                    st.markdown(st.session_state.doc_summaries[f.name])
-                    if st.button("🔄 Regenerate", key=f"regen_{f.name}"):
-                        del st.session_state.doc_summaries[f.name]
+        pending = [name for name, _ in files if name not in st.session_state.doc_summaries]
+        if pending and st.button(f"✨ Summarize All ({len(pending)})", key="gen_all", use_container_width=True):
+            progress = st.progress(0.0, text="Summarizing…")
+            failed: list[str] = []
+            pool = _worker_pool()
+            futures = {pool.submit(_summarize_one, name, vector_db, llm): name for name in pending}
+            for done, fut in enumerate(as_completed(futures), 1):
+                name = futures[fut]
+                try:
+                    summary = fut.result()
+                except Exception:
+                    summary = None
+                if summary is None:
+                    failed.append(name)
+                else:
+                    st.session_state.doc_summaries[name] = summary
+                progress.progress(done / len(pending), text=f"Summarized {done}/{len(pending)}")
+            if failed:
+                st.warning(f"Could not summarize: {', '.join(failed)}")
+            else:
+                st.rerun()
+
+        for name, size in files:
+            with st.expander(f"📄 {name}  ({size / 1024:.0f} KB)", expanded=False):
+                if name in st.session_state.doc_summaries:
+                    st.markdown(st.session_state.doc_summaries[name])
+                    if st.button("🔄 Regenerate", key=f"regen_{name}"):
+                        del st.session_state.doc_summaries[name]
                         st.rerun()
                 else:
                     st.caption("No summary yet.")
-                    if st.button("✨ Generate Summary", key=f"gen_{f.name}", use_container_width=True):
-                        with st.spinner(f"Summarizing {f.name}…"):
-                            doc_results = semantic_search(
-                                vector_db, "summary overview main content",
-                                top_k=8, filter_path=DATA_DIR / f.name,
-                            )
-                            if doc_results:
-                                context = "\n\n".join(r["content"] for r in doc_results)
-                                msgs = [
-                                    SystemMessage(content=(
-                                        "You are a document summarizer. Provide a comprehensive, "
-                                        "well-structured summary. Use markdown with headers and bullets."
-                                    )),
-                                    HumanMessage(content=(
-                                        f"Document: {f.name}\n\nContent:\n{context}\n\nProvide a detailed summary:"
-                                    )),
-                                ]
-                                result = llm.invoke(msgs)
-                                summary = getattr(result, "content", str(result))
-                                st.session_state.doc_summaries[f.name] = summary
+                    if st.button("✨ Generate Summary", key=f"gen_{name}", use_container_width=True):
+                        with st.spinner(f"Summarizing {name}…"):
+                            summary = _summarize_one(name, vector_db, llm)
+                            if summary is not None:
+                                st.session_state.doc_summaries[name] = summary
                                 st.rerun()
                             else:
                                 st.warning("Could not retrieve content for this document.")
@@ -7,8 +7,10 @@ Usage:
 
 from __future__ import annotations
 
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+
 from src.config import DEFAULT_TEMPERATURE, TOP_K
-from src.core import get_rag_stream
+from src.core import get_rag_stream, iter_text
 from src.utils import get_embeddings, get_llm, load_faiss_index
 
 
@@ -39,7 +41,7 @@ def main() -> None:
 
     print("System ready! Type 'exit' to quit.\n")
 
-    history: list[dict[str, str]] = []
+    history: list[BaseMessage] = []
 
     while True:
         try:
@@ -52,16 +54,16 @@ def main() -> None:
             print("\033[92mBot:\033[0m ", end="", flush=True)
 
             stream, _docs = get_rag_stream(query, retriever, llm, chat_history=history)
-            full_response = ""
-            for chunk in stream:
-                content = getattr(chunk, "content", str(chunk))
-                full_response += content
+            parts: list[str] = []
+            for content in iter_text(stream):
+                parts.append(content)
                 print(content, end="", flush=True)
             print("\n")
+            full_response = "".join(parts)
 
             # Maintain conversation history
-            history.append({"role": "user", "content": query})
-            history.append({"role": "assistant", "content": full_response})
+            history.append(HumanMessage(content=query))
+            history.append(AIMessage(content=full_response))
             # Keep last 10 turns
             if len(history) > 20:
                 history = history[-20:]
@@ -0,0 +1,116 @@
+"""
+Response Cache — Exact and semantic lookup of previous RAG answers.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import threading
+from collections import OrderedDict
+
+import faiss
+import numpy as np
+
+from src.config import CACHE_MAX_ENTRIES, CACHE_SIMILARITY
+from src.utils import embed_query
+
+
+_SEARCH_K = 4  # nearest cached prompts checked per semantic lookup
+
+
+class ResponseCache:
+    """Two-layer cache of ``(response, docs, tokens)`` answers.
+
+    Layer 1 is an exact hash of the prompt plus everything that shapes the
+    answer (the *scope*: focus document, system prompt, top-k, model…).
+    Layer 2 embeds the prompt and looks for a paraphrase asked earlier in the
+    same scope, accepting it when cosine similarity ≥ ``threshold``.
+    """
+
+    def __init__(
+        self, embeddings,
+        threshold: float = CACHE_SIMILARITY,
+        max_entries: int = CACHE_MAX_ENTRIES,
+    ):
+        self._embeddings = embeddings
+        self._threshold = threshold
+        self._max_entries = max_entries
+        # key → (scope, answer), in LRU order
+        self._entries: OrderedDict[str, tuple[str, tuple]] = OrderedDict()
+        # scope → (inner-product index over unit prompt vectors, entry key per row).
+        # Rows are removed with their entries, so every row points at a live answer.
+        self._semantic: dict[str, tuple[faiss.IndexFlatIP, list[str]]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def scope(**params) -> str:
+        """Hash the answer-shaping parameters into a scope id."""
+        raw = "\x1f".join(f"{k}={params[k]}" for k in sorted(params))
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _key(query: str, scope: str) -> str:
+        return hashlib.sha256(f"{scope}\x1f{query.strip()}".encode("utf-8")).hexdigest()
+
+    def _as_row(self, query: str, vec: np.ndarray | None) -> np.ndarray:
+        if vec is None:
+            vec = embed_query(self._embeddings, query)
+        return vec.reshape(1, -1)
+
+    def get(self, query: str, scope: str, vec: np.ndarray | None = None) -> tuple | None:
+        """Return the cached ``(response, docs, tokens)`` for *query*, or None.
+
+        *vec* is the unit-length query embedding, if the caller already has
+        one; it is only needed when there is no exact match.
+        """
+        key = self._key(query, scope)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key][1]
+
+        row = self._as_row(query, vec)
+        with self._lock:
+            index, keys = self._semantic.get(scope, (None, None))
+            if index is None:
+                return None
+            scores, rows = index.search(row, min(_SEARCH_K, index.ntotal))
+            for score, i in zip(scores[0], rows[0]):
+                if score < self._threshold:
+                    break
+                hit_key = keys[i]
+                if hit_key in self._entries:
+                    self._entries.move_to_end(hit_key)
+                    return self._entries[hit_key][1]
+        return None
+
+    def put(
+        self, query: str, scope: str,
+        response: str, docs: list, tokens: int,
+        vec: np.ndarray | None = None,
+    ) -> None:
+        """Store an answer under its exact key and its prompt embedding."""
+        key = self._key(query, scope)
+        row = self._as_row(query, vec)
+        with self._lock:
+            if key not in self._entries:
+                index, keys = self._semantic.setdefault(
+                    scope, (faiss.IndexFlatIP(row.shape[1]), []),
+                )
+                index.add(row)
+                keys.append(key)
+            self._entries[key] = (scope, (response, docs, tokens))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_entries:
+                old_key, (old_scope, _) = self._entries.popitem(last=False)
+                self._drop_row(old_scope, old_key)
+
+    def _drop_row(self, scope: str, key: str) -> None:
+        """Remove *key*'s prompt vector, and its scope once empty. Caller holds the lock."""
+        index, keys = self._semantic[scope]
+        i = keys.index(key)
+        # IndexFlat compacts in order, so rows stay aligned with keys
+        index.remove_ids(np.array([i], dtype=np.int64))
+        del keys[i]
+        if not keys:
+            del self._semantic[scope]
@@ -29,8 +29,33 @@ OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
 TOP_K = int(os.getenv("TOP_K", "5"))
 CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", "1000"))
 CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "200"))
+LOAD_WORKERS = int(os.getenv("LOAD_WORKERS", "0"))  # PDF parsing processes (0 = one per spare CPU core)
+MAX_URL_BYTES = int(os.getenv("MAX_URL_BYTES", str(10 * 1024 * 1024)))  # web ingest download cap
 DEFAULT_TEMPERATURE = float(os.getenv("DEFAULT_TEMPERATURE", "0.1"))
 SEARCH_TYPE = os.getenv("SEARCH_TYPE", "similarity").lower()  # "similarity" | "mmr"
+MAX_HISTORY_TURNS = int(os.getenv("MAX_HISTORY_TURNS", "32"))  # user/assistant pairs kept in chat memory
+MAX_HISTORY_TOKENS = int(os.getenv("MAX_HISTORY_TOKENS", "2000"))  # history budget per prompt (≈4 chars/token)
+
+# ── Vector Index ──────────────────────────────────────────────────────────────
+INDEX_TYPE = os.getenv("INDEX_TYPE", "hnsw").lower()  # "hnsw" | "flat" | "ivfpq"
+EMBED_QUANT = os.getenv("EMBED_QUANT", "int8").lower()  # stored vector precision: "int8" | "fp16" | "fp32"
+FAISS_MMAP = os.getenv("FAISS_MMAP", "true").lower() in ("1", "true", "yes")  # demand-page flat/SQ/HNSW vectors from disk
+FAISS_THREADS = int(os.getenv("FAISS_THREADS", str(max(1, (os.cpu_count() or 2) // 2))))  # OpenMP threads ≈ physical cores
+HNSW_M = int(os.getenv("HNSW_M", "16"))  # graph neighbours per node
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "64"))
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "64"))  # default recall/speed trade-off at query time
+HNSW_MIN_CHUNKS = int(os.getenv("HNSW_MIN_CHUNKS", "1000"))  # smaller corpora use an exact flat index
+IVF_MIN_CHUNKS = int(os.getenv("IVF_MIN_CHUNKS", "10000"))  # larger corpora switch from HNSW to IVF-PQ (0 = never)
+IVF_NLIST = int(os.getenv("IVF_NLIST", "256"))  # Voronoi cells (upper bound; scaled down for small corpora)
+PQ_M = int(os.getenv("PQ_M", "32"))  # product-quantizer sub-vectors, i.e. bytes per stored vector
+NPROBE = int(os.getenv("NPROBE", "16"))  # IVF cells scanned per query
+
+# ── Response Cache ────────────────────────────────────────────────────────────
+CACHE_SIMILARITY = float(os.getenv("CACHE_SIMILARITY", "0.9"))  # cosine threshold for a semantic hit
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "256"))
+
+# ── Streaming UI ──────────────────────────────────────────────────────────────
+STREAM_FLUSH_MS = int(os.getenv("STREAM_FLUSH_MS", "50"))  # min ms between UI redraws while streaming
 
 # ── Ensure directories exist ──────────────────────────────────────────────────
 DATA_DIR.mkdir(parents=True, exist_ok=True)
@@ -4,13 +4,23 @@ Core RAG logic — retriever setup, prompt construction, and response generation
 
 from __future__ import annotations
 
-from pathlib import Path
-from typing import List, Tuple
-
+import asyncio
+import hashlib
+import operator
+import queue
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Iterator, List, Tuple
+
+import faiss
+import numpy as np
 from langchain_core.documents import Document
-from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
 
-from src.config import TOP_K, SEARCH_TYPE
+from src.config import MAX_HISTORY_TOKENS, TOP_K, SEARCH_TYPE
+from src.utils import from_source, score_class, search_with_relevance, source_filter, source_name
 
 
 # ── Default System Prompt ──────────────────────────────────────────────────────
@@ -28,12 +38,9 @@ using the CONTEXT provided below. Follow these rules strictly:
 6. Treat document filenames as metadata — if the author or title appears in the filename, state it as fact.
 7. When continuing a conversation, use the chat history for context but always ground answers in the documents."""
 
-_CONTEXT_TEMPLATE = """\
-=== RETRIEVED DOCUMENT CONTEXT ===
-
-{context}
-
-=== END OF CONTEXT ==="""
+# Wrapped around format_docs() output; plain concatenation, no format parsing
+_CTX_PREFIX = "=== RETRIEVED DOCUMENT CONTEXT ===\n\n"
+_CTX_SUFFIX = "\n\n=== END OF CONTEXT ===\n\nQuestion: "
 
 
 # ── Helpers ────────────────────────────────────────────────────────────────────
@@ -43,15 +50,46 @@ def format_docs(docs: List[Document]) -> str:
     if not docs:
         return "(No documents were retrieved.)"
 
-    parts: list[str] = []
-    for i, doc in enumerate(docs, 1):
-        source = Path(doc.metadata.get("source", "Unknown")).name
-        page = doc.metadata.get("page", "?")
-        score = doc.metadata.get("score")
-        score_str = f" | Relevance: {score:.0%}" if score is not None else ""
-        header = f"[Source {i}: {source} | Page {page}{score_str}]"
-        parts.append(f"{header}\n{doc.page_content}")
-    return "\n\n".join(parts)
+    return "\n\n".join(_format_doc(i, doc) for i, doc in enumerate(docs, 1))
+
+
+def _format_doc(i: int, doc: Document) -> str:
+    meta = doc.metadata
+    score = meta.get("score")
+    score_str = f" | Relevance: {score:.0%}" if score is not None else ""
+    return f"[Source {i}: {source_name(meta)} | Page {meta.get('page', '?')}{score_str}]\n{doc.page_content}"
+
+
+_ROLE_MESSAGES = {"user": HumanMessage, "assistant": AIMessage}
+
+
+def _recent_history(chat_history: list, budget: int) -> list:
+    """Newest history entries whose estimated tokens (chars // 4) fit in *budget*."""
+    kept: list = []
+    for msg in reversed(chat_history):
+        content = msg.content if isinstance(msg, BaseMessage) else msg.get("content", "")
+        budget -= len(content) // 4
+        if budget < 0:
+            break
+        kept.append(msg)
+    kept.reverse()
+    return kept
+
+
+def history_key(chat_history: list | None) -> str:
+    """Digest of the history turns an answer would actually be generated with.
+
+    Feed it into a response-cache scope so a follow-up like "tell me more"
+    only matches answers given in the same conversation.
+    """
+    h = hashlib.sha256()
+    for msg in _recent_history(chat_history or [], MAX_HISTORY_TOKENS):
+        if isinstance(msg, BaseMessage):
+            role, content = msg.type, msg.content
+        else:
+            role, content = msg.get("role", ""), msg.get("content", "")
+        h.update(f"{role}\x1f{content}\x1e".encode("utf-8"))
+    return h.hexdigest()
 
 
 def _build_messages(
@@ -62,25 +100,26 @@ def _build_messages(
 ) -> list:
     """Build a list of chat messages: system + history + (context + question).
 
-    Includes up to the last 6 conversation turns for multi-turn context.
+    Includes the most recent conversation turns that fit in
+    ``MAX_HISTORY_TOKENS`` for multi-turn context.
     """
     prompt = system_prompt or DEFAULT_SYSTEM_PROMPT
-    context_block = _CONTEXT_TEMPLATE.format(context=format_docs(docs))
-
-    messages: list = [SystemMessage(content=prompt)]
+    system = _SYSTEM_MESSAGES.get(prompt) or SystemMessage(content=prompt)
+    messages: list = [system]
 
-    # Recent conversation history (last 6 turns)
+    # Recent conversation history within the token budget. Messages are passed
+    # through as-is; UI history dicts ({"role", "content", …}) are converted.
     if chat_history:
-        for msg in chat_history[-6:]:
-            role = msg.get("role")
-            content = msg.get("content", "")
-            if role == "user":
-                messages.append(HumanMessage(content=content))
-            elif role == "assistant":
-                messages.append(AIMessage(content=content))
+        for msg in _recent_history(chat_history, MAX_HISTORY_TOKENS):
+            if isinstance(msg, BaseMessage):
+                messages.append(msg)
+                continue
+            message_cls = _ROLE_MESSAGES.get(msg.get("role"))
+            if message_cls is not None:
+                messages.append(message_cls(content=msg.get("content", "")))
 
     # Current query with context
-    messages.append(HumanMessage(content=f"{context_block}\n\nQuestion: {query}"))
+    messages.append(HumanMessage(content=_CTX_PREFIX + format_docs(docs) + _CTX_SUFFIX + query))
     return messages
 
 
@@ -102,7 +141,7 @@ def get_retriever(
         search_kwargs["lambda_mult"] = lambda_mult
 
     if filter_path is not None:
-        search_kwargs["filter"] = {"source": str(filter_path)}
+        search_kwargs["filter"] = source_filter(filter_path)
 
     return db.as_retriever(search_type=search_type, search_kwargs=search_kwargs)
 
@@ -110,31 +149,117 @@ def get_retriever(
 # ── Similarity search with scores ─────────────────────────────────────────────
 
 def retrieve_with_scores(
-    db, query: str, top_k: int = TOP_K, filter_path=None,
+    db, query: str, top_k: int = TOP_K, filter_path=None, query_vec=None,
 ) -> List[Document]:
-    """Retrieve documents with similarity scores attached to metadata."""
+    """Retrieve documents with similarity scores attached to metadata.
+
+    *query_vec* is an optional precomputed query embedding.
+    """
     kwargs: dict = {}
     if filter_path is not None:
-        kwargs["filter"] = {"source": str(filter_path)}
+        kwargs["filter"] = source_filter(filter_path)
 
-    results = db.similarity_search_with_relevance_scores(query, k=top_k, **kwargs)
+    results = search_with_relevance(db, query, top_k, query_vec, **kwargs)
+
+    return [_stamp_score(doc, score) for doc, score in results]
 
-    docs: list[Document] = []
-    for doc, score in results:
-        doc.metadata["score"] = round(score, 4)
-        docs.append(doc)
-    return docs
+
+def _stamp_score(doc: Document, score: float) -> Document:
+    """Return a copy of *doc* with its score and display fields in metadata.
+
+    Search results are the docstore's own Documents, shared by every query
+    (and held by cached results), so they must never be stamped in place.
+    """
+    metadata = dict(doc.metadata)
+    metadata["score"] = round(score, 4)
+    # Stamp display fields once here so UI reruns only do dict lookups
+    metadata["score_cls"] = score_class(score)
+    metadata["source_name"] = source_name(metadata)
+    return Document(page_content=doc.page_content, metadata=metadata)
+
+
+def retrieve_batch(db, queries: List[str], top_k: int = TOP_K) -> List[List[Document]]:
+    """Retrieve scored documents for several query variants in one FAISS search.
+
+    All *queries* are embedded in a single batch and searched together, which
+    suits multi-query / RAG-Fusion expansion. Returns one list per query, in
+    order; like every scored result, documents are copies made by
+    :func:`_stamp_score`, so the same chunk can carry a different score in
+    each list.
+    """
+    if db is None or not queries:
+        return [[] for _ in queries]
+
+    vecs = np.asarray(db.embedding_function.embed_documents(list(queries)), dtype=np.float32)
+    if db._normalize_L2:
+        faiss.normalize_L2(vecs)
+    scores, rows = db.index.search(vecs, top_k)
+
+    relevance = db._select_relevance_score_fn()
+    batches: list[list[Document]] = []
+    for row_scores, row_ids in zip(scores, rows):
+        docs: list[Document] = []
+        for score, i in zip(row_scores, row_ids):
+            if i == -1:  # fewer than top_k vectors in the index
+                continue
+            doc = db.docstore.search(db.index_to_docstore_id[i])
+            docs.append(_stamp_score(doc, relevance(float(score))))
+        batches.append(docs)
+    return batches
+
+
+def chunks_for_source(db, path, k: int = 8) -> List[Document]:
+    """Return the first *k* chunks of one source file in reading order.
+
+    A docstore metadata scan: no query embedding and no vector search.
+    """
+    if db is None:
+        return []
+    source = str(path)
+    chunks = [doc for doc in db.docstore._dict.values() if from_source(doc.metadata, source)]
+    chunks.sort(key=lambda d: (d.metadata.get("page", 0), d.metadata.get("start_index", 0)))
+    return chunks[:k]
+
+
+_DONE = object()  # end-of-stream sentinel
 
 
 # ── Response generation ───────────────────────────────────────────────────────
 
+_RETRIEVAL_CACHE_SIZE = 256
+# (id(retriever), query) → (retriever, docs). Holding the retriever keeps its
+# id from being reused; a rebuilt index means a new retriever, hence new keys.
+_RETRIEVAL_CACHE: OrderedDict[tuple[int, str], tuple] = OrderedDict()
+_RETRIEVAL_LOCK = threading.Lock()
+
+
+def _invoke_cached(retriever, query: str) -> List[Document]:
+    """``retriever.invoke(query)``, memoised so a repeated question skips embed + search."""
+    key = (id(retriever), query)
+    with _RETRIEVAL_LOCK:
+        hit = _RETRIEVAL_CACHE.get(key)
+        if hit is not None and hit[0] is retriever:
+            _RETRIEVAL_CACHE.move_to_end(key)
+            return list(hit[1])
+
+    docs = retriever.invoke(query)
+    with _RETRIEVAL_LOCK:
+        _RETRIEVAL_CACHE[key] = (retriever, tuple(docs))
+        while len(_RETRIEVAL_CACHE) > _RETRIEVAL_CACHE_SIZE:
+            _RETRIEVAL_CACHE.popitem(last=False)
+    return docs
+
+
 def get_rag_stream(
     query: str, retriever, llm,
     chat_history: list | None = None,
     system_prompt: str | None = None,
 ) -> Tuple:
-    """Retrieve docs → build messages → return (streaming_iterator, docs)."""
-    docs = retriever.invoke(query)
+    """Retrieve docs → build messages → return (streaming_iterator, docs).
+
+    Retrieval is cached per retriever and query; the LLM stream never is.
+    """
+    docs = _invoke_cached(retriever, query)
     messages = _build_messages(query, docs, chat_history, system_prompt)
     return llm.stream(messages), docs
 
@@ -145,13 +270,127 @@ def get_rag_stream_with_scores(
     filter_path=None,
     chat_history: list | None = None,
     system_prompt: str | None = None,
+    query_vec=None,
 ) -> Tuple:
     """Retrieve docs with scores → build messages → return (streaming_iterator, docs)."""
-    docs = retrieve_with_scores(db, query, top_k, filter_path)
+    docs = retrieve_with_scores(db, query, top_k, filter_path, query_vec)
     messages = _build_messages(query, docs, chat_history, system_prompt)
     return llm.stream(messages), docs
 
 
+def get_rag_astream_with_scores(
+    query: str, db, llm, *,
+    top_k: int = TOP_K,
+    filter_path=None,
+    chat_history: list | None = None,
+    system_prompt: str | None = None,
+    query_vec=None,
+    docs: List[Document] | None = None,
+) -> Tuple:
+    """Like :func:`get_rag_stream_with_scores`, but the iterator is ``llm.astream``.
+
+    Pass already-retrieved *docs* (e.g. from a cache) to skip the search.
+    """
+    if docs is None:
+        docs = retrieve_with_scores(db, query, top_k, filter_path, query_vec)
+    messages = _build_messages(query, docs, chat_history, system_prompt)
+    return llm.astream(messages), docs
+
+
+def iter_text(stream) -> Iterator[str]:
+    """Yield the text of each streamed chunk.
+
+    The accessor is picked once from the first chunk — ``.content`` for
+    message chunks, ``str`` for anything else — instead of per token.
+    """
+    chunks = iter(stream)
+    first = next(chunks, _DONE)
+    if first is _DONE:
+        return
+    extract = operator.attrgetter("content") if hasattr(first, "content") else str
+    yield extract(first)
+    for chunk in chunks:
+        yield extract(chunk)
+
+
+# ── Async bridge ───────────────────────────────────────────────────────────────
+
+_loop: asyncio.AbstractEventLoop | None = None
+_loop_lock = threading.Lock()
+
+
+def _background_loop() -> asyncio.AbstractEventLoop:
+    """Event-loop thread shared by every async stream, started on first use.
+
+    Async HTTP clients cached on an LLM bind to the loop of their first
+    request, so a fresh ``asyncio.run`` per answer would break them.
+    """
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="rag-astream", daemon=True).start()
+        return _loop
+
+
+class _StreamError:
+    def __init__(self, exc: Exception):
+        self.exc = exc
+
+
+def iter_async(agen, flush_interval: float) -> Iterator[list]:
+    """Consume an async iterator from synchronous code in time-boxed batches.
+
+    A pump task on the background loop reads the stream into a queue, so
+    tokens keep arriving while the caller is busy rendering the last ones.
+    Each drain cycle yields one list: the items that arrived within
+    *flush_interval* seconds of its first item, plus any backlog already
+    queued when the window closes. The window closes on the clock, so a pause
+    in the stream doesn't hold back what is buffered. Errors raised by the
+    stream are re-raised here.
+    """
+    loop = _background_loop()
+    chunks: queue.SimpleQueue = queue.SimpleQueue()
+
+    async def pump() -> None:
+        try:
+            async for item in agen:
+                chunks.put(item)
+        except Exception as exc:
+            chunks.put(_StreamError(exc))
+        finally:
+            chunks.put(_DONE)
+
+    future = asyncio.run_coroutine_threadsafe(pump(), loop)
+    try:
+        done = False
+        while not done:
+            # One drain cycle: block for the first item, collect until the window closes…
+            batch = [chunks.get()]
+            deadline = time.monotonic() + flush_interval
+            while batch[-1] is not _DONE and (remaining := deadline - time.monotonic()) > 0:
+                try:
+                    batch.append(chunks.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            # …then take whatever else is already queued, so one render covers it all
+            while batch[-1] is not _DONE:
+                try:
+                    batch.append(chunks.get_nowait())
+                except queue.Empty:
+                    break
+            if batch[-1] is _DONE:
+                batch.pop()
+                done = True
+            for item in batch:
+                if isinstance(item, _StreamError):
+                    raise item.exc
+            if batch:
+                yield batch
+    finally:
+        future.cancel()  # stops the pump if the caller quits early
+
+
 # ── AI Personas ────────────────────────────────────────────────────────────────
 
 PERSONAS: dict[str, str] = {
@@ -189,24 +428,35 @@ PERSONAS: dict[str, str] = {
     ),
 }
 
+# Built once at import; custom prompts (e.g. persona + language line) are allocated per call
+_SYSTEM_MESSAGES: dict[str, SystemMessage] = {
+    prompt: SystemMessage(content=prompt)
+    for prompt in (DEFAULT_SYSTEM_PROMPT, *PERSONAS.values())
+}
+
 
 # ── Follow-up question generation ─────────────────────────────────────────────
 
+_FOLLOWUP_SYSTEM = SystemMessage(content=(
+    "You are a helpful assistant that suggests follow-up questions. "
+    "Given a question and its answer, suggest exactly 3 short, "
+    "specific follow-up questions the user might want to ask next. "
+    "Return ONLY the 3 questions, one per line, no numbering, no bullet points."
+))
+
+# One match per non-blank line, already trimmed of surrounding whitespace
+_FOLLOWUP_RE = re.compile(r"\S[^\n]*\S|\S")
+
+
 def generate_followups(query: str, response: str, llm) -> list[str]:
     """Generate 3 suggested follow-up questions based on the conversation."""
     messages = [
-        SystemMessage(content=(
-            "You are a helpful assistant that suggests follow-up questions. "
-            "Given a question and its answer, suggest exactly 3 short, "
-            "specific follow-up questions the user might want to ask next. "
-            "Return ONLY the 3 questions, one per line, no numbering, no bullet points."
-        )),
+        _FOLLOWUP_SYSTEM,
         HumanMessage(content=f"Question: {query}\n\nAnswer: {response[:500]}"),
     ]
     try:
         result = llm.invoke(messages)
         content = getattr(result, "content", str(result))
-        questions = [q.strip() for q in content.strip().split("\n") if q.strip()]
-        return questions[:3]
+        return _FOLLOWUP_RE.findall(content)[:3]
     except Exception:
         return []
@@ -5,30 +5,83 @@ Ingestion — Load documents, chunk them, and build a FAISS vector index.
 from __future__ import annotations
 
 import concurrent.futures
-import re
+import hashlib
+import multiprocessing
+import os
+import sys
+import tempfile
+import uuid
 from pathlib import Path
 from typing import List
 from urllib.parse import urlparse
 
+import faiss
+import numpy as np
 import requests
-from langchain_community.document_loaders import PyPDFLoader, TextLoader
+from langchain_community.docstore.in_memory import InMemoryDocstore
 from langchain_community.vectorstores import FAISS
 from langchain_core.documents import Document
 from langchain_text_splitters import RecursiveCharacterTextSplitter
+from selectolax.lexbor import LexborHTMLParser
 
-from src.config import DATA_DIR, VECTOR_DIR, CHUNK_SIZE, CHUNK_OVERLAP
-from src.utils import get_embeddings
+from src.config import (
+    DATA_DIR,
+    VECTOR_DIR,
+    CHUNK_SIZE,
+    CHUNK_OVERLAP,
+    LOAD_WORKERS,
+    MAX_URL_BYTES,
+    INDEX_TYPE,
+    EMBED_QUANT,
+    HNSW_M,
+    HNSW_EF_CONSTRUCTION,
+    HNSW_MIN_CHUNKS,
+    IVF_MIN_CHUNKS,
+    IVF_NLIST,
+    PQ_M,
+)
+from src.utils import configure_cosine, get_embeddings, source_name
 
-# File extensions we support and their corresponding loaders.
+
+def _pdf_loader(path: Path):
+    from langchain_community.document_loaders.pdf import PyPDFLoader
+
+    return PyPDFLoader(str(path))
+
+
+def _text_loader(path: Path):
+    from langchain_community.document_loaders.text import TextLoader
+
+    return TextLoader(str(path), encoding="utf-8")
+
+
+# File extensions we support and their corresponding loaders. The loader
+# modules (pypdf and friends) are imported on first use, not with this module.
 _LOADERS: dict = {
-    ".pdf": lambda p: PyPDFLoader(str(p)),
-    ".txt": lambda p: TextLoader(str(p), encoding="utf-8"),
-    ".md":  lambda p: TextLoader(str(p), encoding="utf-8"),
+    ".pdf": _pdf_loader,
+    ".txt": _text_loader,
+    ".md":  _text_loader,
 }
 
 
 # ── Loading ────────────────────────────────────────────────────────────────────
 
+# Failures that mean "this file is unreadable, skip it": I/O, bad encoding
+# (TextLoader re-raises it as RuntimeError) and malformed PDFs. Anything else
+# is a bug or a missing dependency and should surface, not be skipped per file.
+_LOAD_ERRORS = (OSError, ValueError, RuntimeError)
+
+
+def _load_errors() -> tuple:
+    """``_LOAD_ERRORS`` plus pypdf's base error once pypdf has been imported.
+
+    Looked up when an exception is being matched, so importing this module
+    doesn't pull in pypdf; if pypdf was never imported, it raised nothing.
+    """
+    pypdf_errors = sys.modules.get("pypdf.errors")
+    return _LOAD_ERRORS + (pypdf_errors.PyPdfError,) if pypdf_errors else _LOAD_ERRORS
+
+
 def _load_single(file_path: Path) -> List[Document]:
     """Load a single file using the appropriate LangChain loader."""
     loader_fn = _LOADERS.get(file_path.suffix.lower())
@@ -36,33 +89,98 @@ def _load_single(file_path: Path) -> List[Document]:
         return []
     try:
         return loader_fn(file_path).load()
-    except Exception as exc:
+    except _load_errors() as exc:
         print(f"[WARNING] Skipped {file_path.name}: {exc}")
         return []
 
 
+# Below this many PDFs, spawning interpreters costs more than parsing saves
+_MIN_PDFS_FOR_PROCESSES = 4
+
+
+def _pdf_workers(n_pdfs: int) -> int:
+    """Parser processes for *n_pdfs* files: LOAD_WORKERS, else one per spare core."""
+    if n_pdfs < _MIN_PDFS_FOR_PROCESSES:
+        return 1
+    workers = LOAD_WORKERS or (os.cpu_count() or 2) - 1
+    return max(1, min(workers, n_pdfs))
+
+
 def load_documents(source_dir: Path = DATA_DIR) -> List[Document]:
-    """Load every supported file from *source_dir* in parallel (I/O-bound)."""
+    """Load every supported file from *source_dir* in parallel.
+
+    PDF parsing is pure-Python and CPU-bound, so PDFs go to worker processes
+    (the GIL would serialise threads); text files are I/O-bound and stay on
+    threads. Set LOAD_WORKERS=1 on spinning disks, where parallel reads seek
+    against each other.
+    """
     if not source_dir.exists():
         print(f"[INFO] Source directory does not exist: {source_dir}")
         return []
 
-    files = [f for ext in _LOADERS for f in source_dir.glob(f"*{ext}")]
+    # One directory pass; DirEntry.is_file() uses the dirent type, no extra stat.
+    # Name order keeps chunk (and FAISS id) order reproducible across runs.
+    suffixes = tuple(_LOADERS)
+    with os.scandir(source_dir) as entries:
+        files = sorted(
+            Path(e.path) for e in entries
+            if e.is_file() and e.name.lower().endswith(suffixes)
+        )
     if not files:
         return []
 
+    pdfs = [f for f in files if f.suffix.lower() == ".pdf"]
+    others = [f for f in files if f.suffix.lower() != ".pdf"]
+    workers = _pdf_workers(len(pdfs))
+
     with concurrent.futures.ThreadPoolExecutor() as pool:
-        batches = list(pool.map(_load_single, files))
+        other_batches = pool.map(_load_single, others)
+        if workers > 1:
+            # spawn, not fork: the app process runs threads (Streamlit, OpenMP)
+            with concurrent.futures.ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+            ) as procs:
+                pdf_batches = list(procs.map(_load_single, pdfs))
+        else:
+            pdf_batches = list(pool.map(_load_single, pdfs))
+        batches = [*pdf_batches, *other_batches]
 
     return [doc for batch in batches for doc in batch]
 
 
 # ── URL Ingestion ──────────────────────────────────────────────────────────────
 
-_STRIP_TAGS_RE = re.compile(r"<[^>]+>")
-_STRIP_SCRIPTS_RE = re.compile(r"<script[^>]*>.*?</script>", re.S)
-_STRIP_STYLES_RE = re.compile(r"<style[^>]*>.*?</style>", re.S)
-_WHITESPACE_RE = re.compile(r"\s+")
+def _html_to_text(html: str) -> str:
+    """Visible text of an HTML page with whitespace collapsed.
+
+    One pass of selectolax's lexbor (C) parser; script/style/noscript content is dropped.
+    """
+    tree = LexborHTMLParser(html)
+    tree.strip_tags(["script", "style", "noscript"])
+    root = tree.body or tree.root
+    return " ".join(root.text(separator=" ").split()) if root is not None else ""
+
+
+# Shared across URL ingests so repeat fetches from a host reuse its connection
+# (and TLS session); kept apart from the local Ollama session in src.utils
+_WEB_SESSION = requests.Session()
+_WEB_SESSION.headers["User-Agent"] = "Mozilla/5.0 (ProRAG Bot)"
+
+
+def _fetch(url: str) -> tuple[bytes, str, str]:
+    """Download *url* in blocks: ``(body, content_type, encoding)``.
+
+    Raises ValueError as soon as the body exceeds MAX_URL_BYTES, so an
+    oversized or endless response never has to fit in memory.
+    """
+    with _WEB_SESSION.get(url, timeout=15, stream=True) as resp:
+        resp.raise_for_status()
+        raw = bytearray()
+        for block in resp.iter_content(chunk_size=65536):
+            raw += block
+            if len(raw) > MAX_URL_BYTES:
+                raise ValueError(f"Page exceeds the {MAX_URL_BYTES / 1_048_576:.1f} MB download limit.")
+        return bytes(raw), resp.headers.get("Content-Type", ""), resp.encoding or "utf-8"
 
 
 def ingest_url(url: str) -> tuple[bool, str]:
@@ -71,18 +189,13 @@ def ingest_url(url: str) -> tuple[bool, str]:
     Returns (success, message).
     """
     try:
-        resp = requests.get(
-            url, timeout=15,
-            headers={"User-Agent": "Mozilla/5.0 (ProRAG Bot)"},
-        )
-        resp.raise_for_status()
-
-        content = resp.text
-        if "<html" in content.lower():
-            content = _STRIP_SCRIPTS_RE.sub("", content)
-            content = _STRIP_STYLES_RE.sub("", content)
-            content = _STRIP_TAGS_RE.sub(" ", content)
-            content = _WHITESPACE_RE.sub(" ", content).strip()
+        raw, ctype, encoding = _fetch(url)
+        content = raw.decode(encoding, errors="replace")
+        # Sniff only the head of the raw bytes, and trust an explicit text/plain
+        if "html" in ctype or (
+            not ctype.startswith("text/plain") and b"<html" in raw[:4096].lower()
+        ):
+            content = _html_to_text(content)
 
         if not content or len(content) < 50:
             return False, "Page content too short or empty."
@@ -118,30 +231,141 @@ def split_documents(
         chunk_overlap=chunk_overlap,
         add_start_index=True,
     )
-    return splitter.split_documents(docs)
+    chunks: list[Document] = []
+    for doc in docs:
+        # Stamped on the chunks (which own their metadata), never on the caller's pages
+        name = source_name(doc.metadata)
+        text = doc.page_content
+        if len(text) > chunk_size:
+            pieces = splitter.split_documents([doc])
+            for piece in pieces:
+                piece.metadata["source_name"] = name
+            chunks.extend(pieces)
+            continue
+        # Already chunk-sized (short notes, web pages): one chunk, no separator
+        # cascade; stripped and offset exactly as the splitter would
+        stripped = text.strip()
+        if stripped:
+            chunks.append(Document(
+                page_content=stripped,
+                metadata={**doc.metadata, "source_name": name, "start_index": text.find(stripped)},
+            ))
+    return chunks
+
+
+def dedupe_chunks(chunks: List[Document]) -> List[Document]:
+    """Drop chunks whose text repeats an earlier chunk (headers, footers, disclaimers).
+
+    When the dropped copy came from another file, the kept chunk records its
+    ``(source, page)`` under ``metadata["also_in"]``, so source filters,
+    stats and attribution still cover that file.
+    """
+    kept: dict[bytes, Document] = {}
+    for chunk in chunks:
+        key = hashlib.blake2b(chunk.page_content.encode("utf-8"), digest_size=16).digest()
+        first = kept.get(key)
+        if first is None:
+            kept[key] = chunk
+            continue
+        source = chunk.metadata.get("source")
+        if source == first.metadata.get("source"):
+            continue  # repeated within one file: nothing new to attribute
+        where = (source, chunk.metadata.get("page", "?"))
+        also_in = first.metadata.get("also_in")
+        if also_in is None:
+            first.metadata["also_in"] = [where]
+        elif where not in also_in:
+            also_in.append(where)
+    return list(kept.values())
 
 
 # ── Index creation ─────────────────────────────────────────────────────────────
 
+_SQ_TYPES: dict = {
+    "int8": faiss.ScalarQuantizer.QT_8bit,
+    "fp16": faiss.ScalarQuantizer.QT_fp16,
+}
+
+
+def _new_faiss_index(dim: int, n: int):
+    """Empty inner-product index of the configured INDEX_TYPE and EMBED_QUANT.
+
+    With INDEX_TYPE "hnsw", corpora under HNSW_MIN_CHUNKS vectors get a flat
+    index (brute force is exact and already fast there) and corpora over
+    IVF_MIN_CHUNKS an IVF-PQ index. Quantized and IVF indexes must be trained
+    before adding vectors.
+    """
+    ip = faiss.METRIC_INNER_PRODUCT
+    if INDEX_TYPE == "ivfpq" or (INDEX_TYPE == "hnsw" and 0 < IVF_MIN_CHUNKS < n):
+        # k-means wants ~39 training points per centroid: fewer cells for
+        # small corpora, and SQ8 codes until PQ's 256-centroid codebooks fit
+        nlist = max(1, min(IVF_NLIST, n // 39))
+        codec = f"PQ{PQ_M}" if n >= 39 * 256 and dim % PQ_M == 0 else "SQ8"
+        return faiss.index_factory(dim, f"IVF{nlist},{codec}", ip)
+
+    qtype = _SQ_TYPES.get(EMBED_QUANT)
+    if INDEX_TYPE == "flat" or (INDEX_TYPE == "hnsw" and n < HNSW_MIN_CHUNKS):
+        return faiss.IndexFlatIP(dim) if qtype is None else faiss.IndexScalarQuantizer(dim, qtype, ip)
+    if qtype is None:
+        index = faiss.IndexHNSWFlat(dim, HNSW_M, ip)
+    else:
+        index = faiss.IndexHNSWSQ(dim, qtype, HNSW_M, ip)
+    index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+    return index
+
+
+def _build_faiss_store(chunks: List[Document], embeddings) -> FAISS:
+    """Embed *chunks* into an inner-product index over L2-normalised vectors."""
+    vectors = np.asarray(
+        embeddings.embed_documents([c.page_content for c in chunks]), dtype="float32",
+    )
+    faiss.normalize_L2(vectors)
+    index = _new_faiss_index(vectors.shape[1], len(vectors))
+    if not index.is_trained:
+        index.train(vectors)
+    index.add(vectors)
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.make_direct_map()  # lets MMR reconstruct stored vectors by id
+
+    ids = [c.id or str(uuid.uuid4()) for c in chunks]
+    docstore = InMemoryDocstore(dict(zip(ids, chunks)))
+    return configure_cosine(FAISS(embeddings, index, docstore, dict(enumerate(ids))))
+
+
 def create_vector_index(
     docs: List[Document],
     save_path: Path = VECTOR_DIR,
     chunk_size: int = CHUNK_SIZE,
     chunk_overlap: int = CHUNK_OVERLAP,
+    embeddings=None,
 ) -> FAISS | None:
-    """Chunk *docs*, embed them, build a FAISS index, and save to disk."""
+    """Chunk *docs*, embed them, build a FAISS index, and save to disk.
+
+    Pass the caller's already-loaded *embeddings* to avoid loading the model again.
+    """
     if not docs:
         print("[INFO] Nothing to index — no documents provided.")
         return None
 
     chunks = split_documents(docs, chunk_size, chunk_overlap)
-    print(f"[INFO] Created {len(chunks)} chunks from {len(docs)} pages.")
+    unique = dedupe_chunks(chunks)
+    print(
+        f"[INFO] Created {len(chunks)} chunks from {len(docs)} pages "
+        f"({len(chunks) - len(unique)} duplicates skipped)."
+    )
+    chunks = unique
 
-    embeddings = get_embeddings()
-    db = FAISS.from_documents(chunks, embeddings)
+    embeddings = embeddings or get_embeddings()
+    db = _build_faiss_store(chunks, embeddings)
 
     save_path.mkdir(parents=True, exist_ok=True)
-    db.save_local(str(save_path))
+    # Write next to the live files and rename over them: a running app that has
+    # index.faiss memory-mapped keeps the old file instead of seeing it truncated
+    with tempfile.TemporaryDirectory(dir=save_path) as tmp:
+        db.save_local(tmp)
+        for name in ("index.pkl", "index.faiss"):
+            os.replace(Path(tmp) / name, save_path / name)
     print(f"[INFO] Vector index saved to {save_path}")
     return db
 
@@ -151,6 +375,7 @@ def create_vector_index(
 def ingest_all(
     chunk_size: int = CHUNK_SIZE,
     chunk_overlap: int = CHUNK_OVERLAP,
+    embeddings=None,
 ) -> None:
     """Full ingestion pipeline: load → chunk → embed → save."""
     print(f"[INFO] Ingesting from {DATA_DIR} …")
@@ -158,7 +383,9 @@ def ingest_all(
     print(f"[INFO] Loaded {len(docs)} pages / sections.")
 
     if docs:
-        create_vector_index(docs, chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+        create_vector_index(
+            docs, chunk_size=chunk_size, chunk_overlap=chunk_overlap, embeddings=embeddings,
+        )
     else:
         print("[WARNING] No valid documents found to ingest.")
 
@@ -4,13 +4,17 @@ Utilities — Embedding model, LLM, FAISS index loaders, and Ollama helpers.
 
 from __future__ import annotations
 
-from pathlib import Path
+import copy
+import functools
+import os
+from typing import TYPE_CHECKING
 
+import faiss
+import numpy as np
 import requests
-from langchain_community.embeddings.fastembed import FastEmbedEmbeddings
+from requests.adapters import HTTPAdapter
 from langchain_community.vectorstores import FAISS
-from langchain_ollama import ChatOllama
-from langchain_openai import ChatOpenAI
+from langchain_community.vectorstores.utils import DistanceStrategy
 
 from src.config import (
     VECTOR_DIR,
@@ -20,10 +24,29 @@ from src.config import (
     OPENAI_API_KEY,
     OPENAI_MODEL,
     DEFAULT_TEMPERATURE,
+    HNSW_EF_SEARCH,
+    NPROBE,
+    FAISS_MMAP,
+    FAISS_THREADS,
 )
 
+# The embedding and chat-model packages (ONNX runtime, openai/httpx SDKs) are
+# imported where they are used, so importing this module stays cheap and a
+# provider's SDK only loads when that provider is selected.
+if TYPE_CHECKING:
+    from langchain_community.embeddings.fastembed import FastEmbedEmbeddings
+
+# Hyper-threads share SIMD units, so FAISS's distance kernels scale with
+# physical cores; oversubscribing only adds OpenMP scheduling overhead
+faiss.omp_set_num_threads(FAISS_THREADS)
+
 OLLAMA_BASE_URL = "http://localhost:11434"
 
+# One keep-alive connection pool for the local Ollama API instead of a new TCP
+# connection per call
+_OLLAMA_SESSION = requests.Session()
+_OLLAMA_SESSION.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=8))
+
 _EMPTY_STATS: dict = {
     "total_chunks": 0,
     "unique_sources": 0,
@@ -41,7 +64,7 @@ def list_ollama_models() -> list[dict]:
     Falls back to a single default entry if the server is unreachable.
     """
     try:
-        resp = requests.get(f"{OLLAMA_BASE_URL}/api/tags", timeout=5)
+        resp = _OLLAMA_SESSION.get(f"{OLLAMA_BASE_URL}/api/tags", timeout=5)
         resp.raise_for_status()
         models = resp.json().get("models", [])
         return [
@@ -59,15 +82,16 @@ def list_ollama_models() -> list[dict]:
 def pull_ollama_model(model_name: str) -> bool:
     """Pull (download) a model from the Ollama registry. Returns True on success."""
     try:
-        resp = requests.post(
+        with _OLLAMA_SESSION.post(
             f"{OLLAMA_BASE_URL}/api/pull",
             json={"name": model_name},
             timeout=600,
             stream=True,
-        )
-        resp.raise_for_status()
-        for _ in resp.iter_lines():
-            pass
+        ) as resp:
+            resp.raise_for_status()
+            # Progress lines are discarded: drain in large byte blocks, no line splitting
+            for _ in resp.iter_content(chunk_size=1024 * 1024):
+                pass
         return True
     except Exception:
         return False
@@ -76,7 +100,7 @@ def pull_ollama_model(model_name: str) -> bool:
 def delete_ollama_model(model_name: str) -> bool:
     """Delete a locally installed Ollama model. Returns True on success."""
     try:
-        resp = requests.delete(
+        resp = _OLLAMA_SESSION.delete(
             f"{OLLAMA_BASE_URL}/api/delete",
             json={"name": model_name},
             timeout=30,
@@ -88,11 +112,23 @@ def delete_ollama_model(model_name: str) -> bool:
 
 # ── Core loaders ───────────────────────────────────────────────────────────────
 
+@functools.lru_cache(maxsize=1)
 def get_embeddings() -> FastEmbedEmbeddings:
-    """Return a FastEmbed embedding model (CPU-optimised, no PyTorch needed)."""
+    """Return the FastEmbed embedding model (CPU-optimised, no PyTorch needed).
+
+    Loaded once per process: the ONNX session is safe to share for inference.
+    """
+    from langchain_community.embeddings.fastembed import FastEmbedEmbeddings
+
     return FastEmbedEmbeddings(model_name=EMBEDDING_MODEL)
 
 
+def embed_query(embeddings, query: str) -> np.ndarray:
+    """Embed *query* as a unit-length float32 vector."""
+    vec = np.asarray(embeddings.embed_query(query), dtype=np.float32)
+    return vec / (np.linalg.norm(vec) + 1e-12)
+
+
 def get_llm(
     temperature: float = DEFAULT_TEMPERATURE,
     model: str | None = None,
@@ -115,6 +151,8 @@ def get_llm(
                 raise ValueError("OpenAI API Key is missing. Enter it in the sidebar.")
             api_key = OPENAI_API_KEY
             
+        from langchain_openai import ChatOpenAI
+
         return ChatOpenAI(
             model=model,
             temperature=temperature,
@@ -122,23 +160,181 @@ def get_llm(
         )
         
     # Default to Ollama
+    from langchain_ollama import ChatOllama
+
     return ChatOllama(model=model, temperature=temperature)
 
 
+def _cosine_relevance(score: float) -> float:
+    """Inner product of unit vectors is cosine similarity; clip it to [0, 1]."""
+    return float(min(1.0, max(0.0, score)))
+
+
+def configure_cosine(db: FAISS) -> FAISS:
+    """Score *db* by inner product over L2-normalised vectors (cosine similarity).
+
+    Stored vectors are normalised once at ingest; queries are normalised here.
+    Set after construction, since the constructor warns about normalize_L2
+    with any strategy other than Euclidean.
+    """
+    db.distance_strategy = DistanceStrategy.MAX_INNER_PRODUCT
+    db._normalize_L2 = True
+    db.override_relevance_score_fn = _cosine_relevance
+    return db
+
+
+def set_search_depth(
+    db: FAISS | None, ef_search: int = HNSW_EF_SEARCH, nprobe: int = NPROBE,
+) -> None:
+    """Set how much of an approximate index is explored per query.
+
+    *ef_search* is the HNSW graph candidate list (FAISS never explores fewer
+    than the k requested); *nprobe* is the number of IVF cells scanned.
+    Higher is closer to exact search but slower. A no-op for flat indexes.
+
+    This changes the index itself, so only use it on an index nobody else is
+    searching yet; per-caller depths go through :func:`with_search_depth`.
+    """
+    if db is None:
+        return
+    if isinstance(db.index, faiss.IndexHNSW):
+        db.index.hnsw.efSearch = ef_search
+    ivf = faiss.try_extract_index_ivf(db.index)
+    if ivf is not None:
+        ivf.nprobe = nprobe
+
+
+class _DepthBoundIndex:
+    """A view of a shared FAISS index that passes its own search params per call."""
+
+    def __init__(self, index, params):
+        self._index = index
+        self._params = params
+
+    def search(self, x, k, **kwargs):
+        return self._index.search(x, k, params=self._params, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._index, name)
+
+
+def with_search_depth(
+    db: FAISS | None, ef_search: int = HNSW_EF_SEARCH, nprobe: int = NPROBE,
+) -> FAISS | None:
+    """A shallow copy of *db* whose searches use *ef_search* / *nprobe*.
+
+    Like :func:`set_search_depth`, but the depth travels with each search as
+    FAISS ``SearchParameters`` instead of being written into the index, so
+    sessions sharing one cached index can't change each other's recall
+    mid-search. The docstore and index data are shared, not copied.
+    """
+    if db is None:
+        return None
+    if isinstance(db.index, faiss.IndexHNSW):
+        params = faiss.SearchParametersHNSW(efSearch=ef_search)
+    elif faiss.try_extract_index_ivf(db.index) is not None:
+        params = faiss.SearchParametersIVF(nprobe=nprobe)
+    else:
+        return db  # flat search has no depth to set
+    view = copy.copy(db)
+    view.index = _DepthBoundIndex(db.index, params)
+    return view
+
+
+def _readahead(path) -> None:
+    """Ask the OS to start reading *path* into the page cache in the background.
+
+    A memory-mapped flat/SQ/HNSW index then faults its vectors in from RAM
+    instead of disk on its first searches (a flat search touches all of them).
+    Best effort; a no-op where posix_fadvise is missing.
+    """
+    if not hasattr(os, "posix_fadvise"):
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+    finally:
+        os.close(fd)
+
+
 def load_faiss_index(embeddings) -> FAISS | None:
     """Load a saved FAISS index from disk, or return None if it doesn't exist."""
     index_file = VECTOR_DIR / "index.faiss"
     if not index_file.exists():
         return None
     try:
-        return FAISS.load_local(
-            str(VECTOR_DIR), embeddings, allow_dangerous_deserialization=True,
-        )
+        # MMAP_IFC maps the stored vector/code arrays in place, so the OS pages
+        # them in on demand (IO_FLAG_MMAP alone only maps IVF inverted lists).
+        # A mapped index is read-only: never add to it, rebuild via ingestion.
+        # Fall back to a plain read where FAISS cannot map the file.
+        io_flags = faiss.IO_FLAG_MMAP_IFC if FAISS_MMAP else 0
+        try:
+            db = FAISS.load_local(
+                str(VECTOR_DIR), embeddings,
+                allow_dangerous_deserialization=True, io_flags=io_flags,
+            )
+        except RuntimeError:
+            if not io_flags:
+                raise
+            db = FAISS.load_local(
+                str(VECTOR_DIR), embeddings, allow_dangerous_deserialization=True,
+            )
+        # Indexes built before the switch to inner product stay on L2 until re-ingested
+        if db.index.metric_type == faiss.METRIC_INNER_PRODUCT:
+            configure_cosine(db)
+        ivf = faiss.try_extract_index_ivf(db.index)
+        if io_flags and ivf is None:
+            # Only non-IVF indexes stay mapped; IVF lists were read in already
+            _readahead(index_file)
+        if ivf is not None:
+            # Chat searches one query at a time: split its probed lists across
+            # threads rather than parallelising over (a single) query
+            ivf.parallel_mode = 1
+        set_search_depth(db)
+        return db
     except Exception as exc:
         print(f"[WARNING] Failed to load FAISS index: {exc}")
         return None
 
 
+def search_with_relevance(
+    db: FAISS, query: str, k: int, query_vec: np.ndarray | None = None, **kwargs,
+) -> list[tuple]:
+    """``(doc, relevance)`` pairs for *query*; reuses *query_vec* instead of re-embedding."""
+    if query_vec is None:
+        return db.similarity_search_with_relevance_scores(query, k=k, **kwargs)
+    relevance = db._select_relevance_score_fn()
+    return [
+        (doc, relevance(score))
+        for doc, score in db.similarity_search_with_score_by_vector(query_vec, k=k, **kwargs)
+    ]
+
+
+# ── Display metadata ───────────────────────────────────────────────────────────
+
+def source_name(metadata: dict) -> str:
+    """File name of a chunk's source, stamped at ingest (derived for older indexes)."""
+    return metadata.get("source_name") or os.path.basename(metadata.get("source", "Unknown"))
+
+
+def from_source(metadata: dict, source: str) -> bool:
+    """Whether a chunk came from *source*, directly or as a deduplicated copy."""
+    return metadata.get("source") == source or any(
+        src == source for src, _ in metadata.get("also_in", ())
+    )
+
+
+def source_filter(path):
+    """FAISS metadata filter for chunks of one source file (see :func:`from_source`)."""
+    source = str(path)
+    return lambda metadata: from_source(metadata, source)
+
+
+def score_class(score: float) -> str:
+    """CSS class of the relevance badge for *score*."""
+    return "score-high" if score >= 0.7 else ("score-mid" if score >= 0.4 else "score-low")
+
+
 # ── Analytics ──────────────────────────────────────────────────────────────────
 
 def get_index_stats(db) -> dict:
@@ -148,16 +344,19 @@ def get_index_stats(db) -> dict:
 
     try:
         all_docs = db.docstore._dict
-        total = len(all_docs)
-        sources: set[str] = set()
-        pages: set[str] = set()
-        for doc in all_docs.values():
-            src = Path(doc.metadata.get("source", "Unknown")).name
-            sources.add(src)
-            page = doc.metadata.get("page", "?")
-            pages.add(f"{src}:{page}")
+        # One pass over the docstore; sources are derived from the (source, page) pairs
+        pages = {
+            (source_name(doc.metadata), doc.metadata.get("page", "?"))
+            for doc in all_docs.values()
+        }
+        # Files represented only through deduplicated copies (``also_in``)
+        pages.update(
+            (os.path.basename(src), page)
+            for doc in all_docs.values() for src, page in doc.metadata.get("also_in", ())
+        )
+        sources = {src for src, _ in pages}
         return {
-            "total_chunks": total,
+            "total_chunks": len(all_docs),
             "unique_sources": len(sources),
             "total_pages": len(pages),
             "sources": sorted(sources),
@@ -169,23 +368,27 @@ def get_index_stats(db) -> dict:
 # ── Semantic search ────────────────────────────────────────────────────────────
 
 def semantic_search(
-    db, query: str, top_k: int = 10, filter_path=None,
+    db, query: str, top_k: int = 10, filter_path=None, query_vec: np.ndarray | None = None,
 ) -> list[dict]:
-    """Run a pure semantic search (no LLM) and return scored results."""
+    """Run a pure semantic search (no LLM) and return scored results.
+
+    Pass *query_vec* (from :func:`embed_query`) to skip embedding the query.
+    """
     if db is None:
         return []
     try:
         kwargs: dict = {}
         if filter_path is not None:
-            kwargs["filter"] = {"source": str(filter_path)}
+            kwargs["filter"] = source_filter(filter_path)
 
-        results = db.similarity_search_with_relevance_scores(query, k=top_k, **kwargs)
+        results = search_with_relevance(db, query, top_k, query_vec, **kwargs)
         return [
             {
                 "content": doc.page_content,
-                "source": Path(doc.metadata.get("source", "Unknown")).name,
+                "source": source_name(doc.metadata),
                 "page": doc.metadata.get("page", "?"),
                 "score": round(score, 4),
+                "score_cls": score_class(score),
             }
             for doc, score in results
         ]
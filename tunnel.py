@@ -12,13 +12,48 @@ Usage:
 """
 
 import argparse
+import signal
 import sys
+import threading
 import time
 
-from pyngrok import ngrok, conf
+
+def _wait_forever():
+    """Block until Ctrl+C without waking up periodically."""
+    if hasattr(signal, "pause"):
+        # POSIX: sleep in the kernel until SIGINT arrives
+        signal.pause()
+        return
+    if sys.platform == "win32":
+        # Ctrl+C cannot interrupt a lock wait on Windows, but it does interrupt sleep
+        while True:
+            time.sleep(3600)
+    threading.Event().wait()
+
+
+def _set_token(token):
+    """Save the ngrok authtoken to pyngrok's config file."""
+    from pyngrok import ngrok
+
+    ngrok.set_auth_token(token)
+    print(f"✅ Authtoken saved! You can now run: python tunnel.py")
+
+
+def _find_tunnel(ngrok, port):
+    """Return an HTTP tunnel the running ngrok agent already has open to *port*, if any."""
+    for tunnel in ngrok.get_tunnels():
+        upstream = tunnel.upstream.get("url", "")
+        if tunnel.proto in (None, "http", "https") and upstream.rstrip("/").endswith(f":{port}"):
+            return tunnel
+    return None
 
 
 def main():
+    # One-shot token setup skips building the argument parser
+    if len(sys.argv) == 3 and sys.argv[1] == "--set-token":
+        _set_token(sys.argv[2])
+        return
+
     parser = argparse.ArgumentParser(description="Expose Streamlit via ngrok tunnel")
     parser.add_argument("--port", type=int, default=8501, help="Local port (default: 8501)")
     parser.add_argument("--set-token", type=str, help="Set ngrok authtoken (one-time setup)")
@@ -26,32 +61,37 @@ def main():
 
     # Set authtoken if provided
     if args.set_token:
-        ngrok.set_auth_token(args.set_token)
-        print(f"✅ Authtoken saved! You can now run: python tunnel.py")
+        _set_token(args.set_token)
         return
 
+    # Imported after argparse so --help and usage errors don't load pyngrok
+    from pyngrok import ngrok
+
     # Open tunnel
     print(f"🚀 Opening ngrok tunnel to localhost:{args.port}...")
+    tunnel = None
     try:
-        tunnel = ngrok.connect(args.port, "http")
-        public_url = tunnel.public_url
-        print()
-        print("=" * 60)
-        print(f"  🌐 PUBLIC URL:  {public_url}")
-        print(f"  📱 Share this URL with any device on any network!")
-        print(f"  🔗 Local:       http://localhost:{args.port}")
-        print("=" * 60)
-        print()
-        print("Press Ctrl+C to stop the tunnel.\n")
-
-        # Keep alive
-        while True:
-            time.sleep(1)
+        tunnel = _find_tunnel(ngrok, args.port) or ngrok.connect(
+            addr=args.port, proto="http", bind_tls=True,
+        )
+        rule = "=" * 60
+        sys.stdout.write(
+            f"\n{rule}\n"
+            f"  🌐 PUBLIC URL:  {tunnel.public_url}\n"
+            "  📱 Share this URL with any device on any network!\n"
+            f"  🔗 Local:       http://localhost:{args.port}\n"
+            f"{rule}\n\n"
+            "Press Ctrl+C to stop the tunnel.\n\n"
+        )
+        sys.stdout.flush()
+
+        # Keep alive until Ctrl+C
+        _wait_forever()
 
     except KeyboardInterrupt:
         print("\n🛑 Shutting down tunnel...")
-        ngrok.disconnect(tunnel.public_url)
-        ngrok.kill()
+        if tunnel is not None:
+            ngrok.disconnect(tunnel.public_url)
         print("✅ Tunnel closed.")
 
     except Exception as e:
@@ -61,6 +101,10 @@ def main():
         print("\n   Get a free token at: https://dashboard.ngrok.com/signup")
         sys.exit(1)
 
+    finally:
+        # Stop the agent on every exit path so no orphan keeps the session open
+        ngrok.kill()
+
 
 if __name__ == "__main__":
     main()